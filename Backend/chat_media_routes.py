@@ -6,35 +6,159 @@ Routes API pour le Chat avec support Média
 À intégrer dans votre backend Flask existant.
 
 Installation requise:
-    pip install openai python-dotenv werkzeug pillow PyPDF2
+    pip install openai "httpx[http2]" python-dotenv werkzeug pyvips pillow pypdfium2 streaming-form-data blake3 python-magic
+    ffmpeg / ffprobe dans le PATH (découpage des audios longs)
 
 Configuration .env:
     OPENAI_API_KEY=sk-...
 """
 
+import io
 import os
+import re
+import atexit
+import shutil
+import json
+import mmap
+import fcntl
+import struct
 import uuid
+import hashlib
+import mimetypes
+import time
+import queue
 import tempfile
+import threading
+import subprocess
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from difflib import SequenceMatcher
 from datetime import datetime
+from contextlib import contextmanager
 from functools import wraps
 
-from flask import Blueprint, request, jsonify, current_app
+import httpx
+import magic
+from flask import Blueprint, request, jsonify, current_app, send_from_directory, abort
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 from openai import OpenAI
+from streaming_form_data import StreamingFormDataParser
+from streaming_form_data.targets import BaseTarget, ValueTarget
 
 # Blueprint pour les routes média du chat
 chat_media_bp = Blueprint('chat_media', __name__, url_prefix='/api/chat')
 
+# Blueprint servant les fichiers uploadés du chat
+chat_uploads_bp = Blueprint('chat_uploads', __name__, url_prefix='/uploads/chat')
+
 # Configuration
-ALLOWED_AUDIO_EXTENSIONS = {'m4a', 'mp3', 'wav', 'webm', 'ogg', 'flac'}
-ALLOWED_IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp', 'heic'}
-ALLOWED_DOCUMENT_EXTENSIONS = {'pdf', 'txt', 'md'}
+ALLOWED_AUDIO_EXTENSIONS = frozenset({'m4a', 'mp3', 'wav', 'webm', 'ogg', 'flac'})
+ALLOWED_IMAGE_EXTENSIONS = frozenset({'jpg', 'jpeg', 'png', 'gif', 'webp', 'heic'})
+ALLOWED_DOCUMENT_EXTENSIONS = frozenset({'pdf', 'txt', 'md'})
+ALL_UPLOAD_EXTENSIONS = ALLOWED_IMAGE_EXTENSIONS | ALLOWED_DOCUMENT_EXTENSIONS
+EXT_TO_TYPE = {ext: 'audio' for ext in ALLOWED_AUDIO_EXTENSIONS}
+EXT_TO_TYPE.update({ext: 'image' for ext in ALLOWED_IMAGE_EXTENSIONS})
+EXT_TO_TYPE.update({ext: 'document' for ext in ALLOWED_DOCUMENT_EXTENSIONS})
+# Types MIME acceptés après détection du contenu (libmagic) -> type de fichier attendu
+ALLOWED_UPLOAD_MIMES = {
+    'image/jpeg': 'image',
+    'image/png': 'image',
+    'image/gif': 'image',
+    'image/webp': 'image',
+    'image/heic': 'image',
+    'image/heif': 'image',
+    'application/pdf': 'document'
+}
+# Documents texte : libmagic y voit du Python, du JSON, du CSV... tout `text/*` est
+# accepté, et le type renvoyé reste celui de l'extension
+TEXT_DOCUMENT_MIMES = {'txt': 'text/plain', 'md': 'text/markdown'}
+TEXT_SNIFFED_MIMES = frozenset({'application/json', 'application/x-empty'})
+MIME_SNIFF_SIZE = 512              # Octets lus par libmagic pour détecter le type
+AUDIO_FORMAT_ERROR = f'Format audio non supporté. Formats acceptés: {", ".join(ALLOWED_AUDIO_EXTENSIONS)}'
+UPLOAD_FORMAT_ERROR = f'Format non supporté. Formats acceptés: {", ".join(ALL_UPLOAD_EXTENSIONS)}'
 MAX_AUDIO_SIZE = 25 * 1024 * 1024  # 25 MB (limite Whisper)
 MAX_FILE_SIZE = 20 * 1024 * 1024   # 20 MB
+MULTIPART_OVERHEAD = 64 * 1024     # Marge du corps multipart (séparateurs, en-têtes, champs)
+UPLOAD_CACHE_MAX_AGE = 30 * 24 * 3600  # Fichiers immuables : cache client de 30 jours
+UPLOAD_TTL = 0                     # Expiration des uploads désactivée par défaut (CHAT_UPLOADS_TTL, s)
+UPLOAD_CLEANUP_INTERVAL = 3600     # Période du nettoyage des uploads expirés (s)
+THUMB_PACK_MAX_SIZE = 64 * 1024    # Miniatures rangées dans un pack en deçà, fichier séparé au-delà
+THUMB_PACK_SEGMENT_SIZE = 64 * 1024 * 1024  # Taille d'un pack avant d'en ouvrir un nouveau
+RESULT_CACHE_SIZE = 256            # Transcriptions / textes PDF gardés en mémoire par processus
+STREAM_CHUNK_SIZE = 64 * 1024      # Taille des blocs lus sur le socket
+STREAM_QUEUE_SIZE = 32             # Blocs en attente d'envoi vers Whisper (~2 MB)
+TRANSCRIPTION_JOB_TTL = 15 * 60    # Durée de conservation d'un résultat non récupéré (s)
+TRANSCRIPTION_MAX_PARALLEL = 16    # Transcriptions simultanées par worker (au-delà : 503)
+STREAMING_AUDIO_MAX_BYTES = 1024 * 1024  # Au-delà (~60 s d'AAC), l'audio est écrit sur disque pour découpage
+LONG_AUDIO_MIN_DURATION = 60       # Au-delà (s), transcription par fenêtres parallèles
+AUDIO_CHUNK_SECONDS = 30           # Fenêtre de traitement de Whisper
+AUDIO_CHUNK_OVERLAP = 2            # Recouvrement entre deux fenêtres (s)
+WHISPER_MAX_PARALLEL = 8           # Appels Whisper simultanés pour un audio long
+AUDIO_SPOOL_SLOTS = os.cpu_count() or 4  # Fichiers temporaires réutilisés par worker
+# Transcodage avant envoi : Whisper travaille en 16 kHz mono, l'Opus 24 kb/s suffit
+WHISPER_AUDIO_ARGS = ['-ac', '1', '-ar', '16000', '-c:a', 'libopus', '-b:a', '24k']
+
+# Seuls chemins servis sous /uploads/chat : fichiers publiés et miniatures
+PUBLIC_UPLOAD_PATH = re.compile(r'(?:thumbs/)?file_[0-9a-f]{12}(?P<thumb>_thumb)?\.(?P<ext>[a-z0-9]+)')
+
+# Identifiant d'une transcription asynchrone
+TRANSCRIPTION_JOB_ID = re.compile(r'job_[0-9a-f]{12}')
+
+# Journal d'allocation des uploads : un enregistrement de 32 octets par fichier publié
+# (identifiant hexa, index d'extension, drapeaux, pack de la miniature, date d'upload,
+# position et taille de la miniature dans son pack)
+ALLOC_LOG_NAME = '_alloc.log'
+ALLOC_RECORD = struct.Struct('<12sBBHIQI')
+ALLOC_FLAGS_OFFSET = 13
+ALLOC_DELETED = 0x01
+# Seul l'index est stocké dans le journal : ordre figé, ajouter en fin de liste
+ALLOC_EXTENSIONS = ('jpg', 'jpeg', 'png', 'gif', 'webp', 'heic', 'pdf', 'txt', 'md')
 
 # Client OpenAI (initialisé au premier appel)
 _openai_client = None
 
+# Transcriptions en cours (une place par requête, réservée à la soumission)
+_transcription_executor = ThreadPoolExecutor(max_workers=TRANSCRIPTION_MAX_PARALLEL)
+_transcription_slots = threading.BoundedSemaphore(TRANSCRIPTION_MAX_PARALLEL)
+
+# Appels Whisper parallèles sur les fenêtres d'un audio long
+_whisper_chunk_executor = ThreadPoolExecutor(max_workers=WHISPER_MAX_PARALLEL)
+
+# Traitements différés des uploads (miniatures) : la réponse n'attend pas le décodage
+_media_executor = ThreadPoolExecutor(max_workers=4)
+
+# Résultats coûteux (Whisper, extraction PDF) par hash de contenu, du plus ancien
+# au plus récemment utilisé
+_result_cache = OrderedDict()
+_result_cache_lock = threading.Lock()
+
+# Packs de miniatures mappés en lecture : chemin -> mmap
+_thumb_packs = {}
+_thumb_packs_lock = threading.Lock()
+
+def create_http_client():
+    """
+    Client HTTP partagé par tous les appels OpenAI.
+
+    Les connexions TLS vers api.openai.com restent ouvertes entre les requêtes, et
+    HTTP/2 (si `h2` est installé) multiplexe les appels Whisper parallèles sur une
+    seule connexion.
+    """
+    try:
+        import h2  # noqa: F401
+        http2 = True
+    except ImportError:
+        http2 = False
+
+    return httpx.Client(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=100, keepalive_expiry=60.0),
+        timeout=httpx.Timeout(120.0, connect=5.0),
+        http2=http2
+    )
+
+
 def get_openai_client():
     """Récupère ou crée le client OpenAI."""
     global _openai_client
@@ -42,27 +166,1159 @@ def get_openai_client():
         api_key = os.environ.get('OPENAI_API_KEY')
         if not api_key:
             raise ValueError("OPENAI_API_KEY non configurée dans les variables d'environnement")
-        _openai_client = OpenAI(api_key=api_key)
+        _openai_client = OpenAI(api_key=api_key, http_client=create_http_client())
     return _openai_client
 
 
-def allowed_file(filename, allowed_extensions):
+def get_extension(filename):
+    """Extension en minuscules du fichier ('' si absente), calculée une seule fois par requête."""
+    _, dot, ext = filename.rpartition('.')
+    return ext.lower() if dot else ''
+
+
+def new_file_id():
+    """Identifiant unique d'un fichier uploadé (48 bits aléatoires)."""
+    return f"file_{os.urandom(6).hex()}"
+
+
+def parse_upload_filename(name):
+    """Renvoie (nom sécurisé, extension en minuscules, identifiant de fichier)."""
+    return secure_filename(name), get_extension(name), new_file_id()
+
+
+def allowed_file(ext, allowed_extensions):
     """Vérifie si l'extension du fichier est autorisée."""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in allowed_extensions
+    return ext in allowed_extensions
 
 
-def get_file_type(filename):
+def get_file_type(ext):
     """Détermine le type de fichier basé sur l'extension."""
-    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    return EXT_TO_TYPE.get(ext, 'unknown')
+
+
+class UploadError(Exception):
+    """Upload refusé (format, taille...) : le message est renvoyé au client en 400."""
+
+
+class TranscriptionBusy(Exception):
+    """Toutes les places de transcription du worker sont prises : renvoyé au client en 503."""
+
+
+class ValidatedTarget(BaseTarget, ABC):
+    """
+    Base des cibles streaming_form_data pour les fichiers uploadés.
+
+    L'extension est vérifiée dès la lecture des en-têtes de la partie et la taille
+    à chaque bloc reçu : un upload invalide est interrompu sans être bufferisé.
+    Les sous-classes implémentent `open_part`, `write_part` et `close_part`.
+    """
+
+    def __init__(self, allowed_extensions, max_size, format_error):
+        super().__init__()
+        self.allowed_extensions = allowed_extensions
+        self.max_size = max_size
+        self.format_error = format_error
+        self.safe_name = None
+        self.ext = None
+        self.file_id = None
+        self.size = 0
+        self.complete = False
+
+    def on_start(self):
+        filename = self.multipart_filename or ''
+        if filename == '':
+            raise UploadError('Nom de fichier vide')
+        safe_name, ext, file_id = parse_upload_filename(filename)
+        if not allowed_file(ext, self.allowed_extensions):
+            raise UploadError(self.format_error)
+
+        self.safe_name = safe_name
+        self.ext = ext
+        self.file_id = file_id
+        self.open_part()
+
+    def on_data_received(self, chunk):
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise UploadError(
+                f'Fichier trop volumineux. Maximum: {self.max_size // (1024*1024)} MB'
+            )
+        self.write_part(chunk)
+
+    def on_finish(self):
+        self.close_part()
+        self.complete = True
+
+    @abstractmethod
+    def open_part(self):
+        """Prépare la réception de la partie (extension déjà validée)."""
+
+    @abstractmethod
+    def write_part(self, chunk):
+        """Traite un bloc de la partie (taille déjà vérifiée)."""
+
+    def close_part(self):
+        pass
+
+
+class LanguageTarget(ValueTarget):
+    """
+    Champ `language` de la transcription.
+
+    `received` indique que le champ a été lu : l'audio n'est relayé vers Whisper
+    pendant sa réception que si la langue est connue avant lui. Une fois le relais
+    démarré (`locked`), un champ `language` placé après l'audio est refusé plutôt
+    qu'ignoré.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.received = False
+        self.locked = False
+
+    def on_start(self):
+        if self.locked:
+            raise UploadError(
+                "Le champ 'language' doit précéder 'audio' (ou passer par ?language=)"
+            )
+        self.received = True
+
+
+def new_content_hash():
+    """Hash de contenu : BLAKE3 (C vectorisé SIMD) si installé, sinon BLAKE2b."""
+    try:
+        from blake3 import blake3
+        return blake3()
+    except ImportError:
+        return hashlib.blake2b(digest_size=32)
+
+
+class UploadTarget(ValidatedTarget):
+    """
+    Écrit la partie fichier directement dans `folder/basename.ext` (`basename` par
+    défaut : l'identifiant de fichier généré pour la partie).
+
+    Le contenu est hashé dans la même boucle d'écriture : `digest` est disponible
+    une fois la partie terminée, sans relire le fichier.
+
+    Avec `allowed_mimes`, le type réel est détecté par libmagic sur les premiers
+    octets reçus (`mime`) : un contenu non autorisé, ou qui ne correspond pas au
+    type annoncé par l'extension, interrompt l'upload. Les documents texte
+    (`TEXT_DOCUMENT_MIMES`) acceptent tout contenu texte et gardent le type de
+    leur extension.
+    """
+
+    def __init__(self, folder, allowed_extensions, max_size, format_error,
+                 allowed_mimes=None, basename=None):
+        super().__init__(allowed_extensions, max_size, format_error)
+        self.folder = folder
+        self.basename = basename
+        self.allowed_mimes = allowed_mimes
+        self.mime = None
+        self.path = None
+        self._file = None
+        self._hash = new_content_hash()
+        self._head = b''
+
+    @property
+    def digest(self):
+        return self._hash.hexdigest()
+
+    def open_part(self):
+        self.path = os.path.join(self.folder, f"{self.basename or self.file_id}.{self.ext}")
+        self._file = open(self.path, 'wb')
+
+    def write_part(self, chunk):
+        if self.allowed_mimes is not None and self.mime is None:
+            self._head += chunk
+            if len(self._head) >= MIME_SNIFF_SIZE:
+                self._sniff()
+
+        self._file.write(chunk)
+        self._hash.update(chunk)
+
+    def close_part(self):
+        self._file.close()
+        if self.allowed_mimes is not None and self.mime is None:
+            self._sniff()
+
+    def _sniff(self):
+        mime = magic.from_buffer(self._head[:MIME_SNIFF_SIZE], mime=True)
+        self._head = b''
+
+        if self.ext in TEXT_DOCUMENT_MIMES:
+            allowed = mime.startswith('text/') or mime in TEXT_SNIFFED_MIMES
+            self.mime = TEXT_DOCUMENT_MIMES[self.ext]
+        else:
+            allowed = self.allowed_mimes.get(mime) == get_file_type(self.ext)
+            self.mime = mime
+
+        if not allowed:
+            raise UploadError(f'Contenu du fichier non supporté ({mime})')
+
+    def discard(self):
+        """Supprime le fichier écrit (upload interrompu, refusé ou fichier temporaire consommé)."""
+        if self._file is not None:
+            self._file.close()
+        if self.path:
+            remove_file(self.path)
+
+
+class AudioSpoolPool:
+    """
+    Anneau de fichiers temporaires réutilisés pour les audios écrits sur disque.
+
+    Chaque processus crée ses fichiers dans son propre dossier au premier besoin :
+    un audio réécrit un fichier libre au lieu d'en créer puis d'en supprimer un
+    (création et suppression d'inode évitées). Libéré, le fichier est tronqué.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._free = []
+
+    def acquire(self):
+        """Chemin d'un fichier libre, ou None si tous sont pris."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Premier appel, ou processus forké après l'import (workers gunicorn)
+                folder = tempfile.mkdtemp(prefix='audio_spool_')
+                atexit.register(shutil.rmtree, folder, True)
+                self._free = [os.path.join(folder, f"slot_{index}") for index in range(self.size)]
+                self._pid = os.getpid()
+            return self._free.pop() if self._free else None
+
+    def release(self, path):
+        """Remet un fichier dans l'anneau, vidé de son contenu."""
+        os.truncate(path, 0)
+        with self._lock:
+            self._free.append(path)
+
+
+_audio_spool_pool = AudioSpoolPool(AUDIO_SPOOL_SLOTS)
+
+
+class SpooledAudioTarget(UploadTarget):
+    """
+    Écrit la partie audio dans un fichier de `_audio_spool_pool` (ou, si tous sont
+    pris, dans un fichier jetable du dossier temporaire).
+    """
+
+    def __init__(self, allowed_extensions, max_size, format_error):
+        super().__init__(tempfile.gettempdir(), allowed_extensions, max_size, format_error,
+                         basename=f"audio_{uuid.uuid4().hex}")
+        self._slot = None
+
+    def open_part(self):
+        self._slot = _audio_spool_pool.acquire()
+        if self._slot is None:
+            super().open_part()
+            return
+
+        self.path = self._slot
+        self._file = open(self.path, 'wb')
+
+    def discard(self):
+        """Rend le fichier au pool (ou supprime le fichier jetable)."""
+        if self._slot is None:
+            super().discard()
+            return
+
+        self._file.close()
+        slot, self._slot, self.path = self._slot, None, None
+        _audio_spool_pool.release(slot)
+
+
+class WhisperStreamTarget(SpooledAudioTarget):
+    """
+    Relaie la partie audio vers Whisper pendant sa réception, sans fichier temporaire.
+
+    Dès les en-têtes de la partie lus, l'appel Whisper démarre sur l'exécuteur des
+    transcriptions ;
+    le client HTTP d'OpenAI consomme les blocs via `read()` au fur et à mesure qu'ils
+    arrivent du socket. Le résultat est disponible dans `self.future`.
+
+    Le relais suppose la langue connue avant l'audio (champ `language` placé avant,
+    ou `?language=`). Sinon (anciennes versions de l'app, qui envoient la langue
+    après l'audio), la partie est écrite sur disque comme un audio long (`spooled`)
+    et la transcription attend la fin du corps.
+    """
+
+    def __init__(self, allowed_extensions, max_size, format_error, language_target,
+                 default_language, language_known):
+        super().__init__(allowed_extensions, max_size, format_error)
+        self.language_target = language_target
+        self.default_language = default_language
+        self.language_known = language_known
+        self.language = None
+        self.spooled = False
+        self.future = Future()
+        self._chunks = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+        self._buffer = b''
+        self._eof = False
+
+    def open_part(self):
+        if not (self.language_known or self.language_target.received):
+            self.spooled = True
+            super().open_part()
+            return
+
+        self.language = self.language_target.value.decode('utf-8') or self.default_language
+        self.language_target.locked = True
+        client = get_openai_client().with_options(max_retries=0)  # Corps non rejouable
+
+        try:
+            submit_transcription(self._transcribe, client)
+        except TranscriptionBusy as e:
+            self.future.set_exception(e)  # Personne ne consommera les blocs
+            raise
+
+    def write_part(self, chunk):
+        if self.spooled:
+            super().write_part(chunk)
+        else:
+            self._put(chunk)
+
+    def close_part(self):
+        if self.spooled:
+            super().close_part()
+        else:
+            self._put(None)
+
+    def discard(self):
+        """Interrompt l'envoi en cours vers Whisper (upload refusé ou incomplet)."""
+        if self.spooled:
+            super().discard()
+        elif self.ext is not None:
+            self._put(UploadError('Upload audio interrompu'))
+
+    def read(self, size=-1):
+        """Interface fichier (bloquante) lue par le client HTTP d'OpenAI."""
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = self._chunks.get()
+            if chunk is None:
+                self._eof = True
+            elif isinstance(chunk, Exception):
+                raise chunk
+            else:
+                self._buffer += chunk
+
+        if size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def _put(self, item):
+        # Si l'appel Whisper a déjà échoué, plus personne ne consomme la file
+        while not self.future.done():
+            try:
+                self._chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def _transcribe(self, client):
+        try:
+            file = (self.multipart_filename, self)
+            if self.multipart_content_type:
+                file += (self.multipart_content_type,)
+
+            transcript = client.audio.transcriptions.create(
+                model="whisper-1",
+                file=file,
+                language=self.language,
+                response_format="verbose_json"
+            )
+            self.future.set_result({
+                'text': transcript.text,
+                'duration': getattr(transcript, 'duration', None)
+            })
+        except BaseException as e:
+            self.future.set_exception(e)
+
+
+def get_cached_result(key):
+    """Résultat déjà calculé pour ce contenu (None si absent)."""
+    with _result_cache_lock:
+        result = _result_cache.get(key)
+        if result is not None:
+            _result_cache.move_to_end(key)
+        return result
+
+
+def cache_result(key, result):
+    """Mémorise un résultat, en évinçant le moins récemment utilisé au-delà de RESULT_CACHE_SIZE."""
+    with _result_cache_lock:
+        _result_cache[key] = result
+        _result_cache.move_to_end(key)
+        while len(_result_cache) > RESULT_CACHE_SIZE:
+            _result_cache.popitem(last=False)
+
+
+def get_chat_upload_folder():
+    """Dossier de stockage des fichiers du chat."""
+    upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
+    return os.path.join(upload_folder, 'chat')
+
+
+def remove_file(path):
+    """Supprime un fichier en un seul appel système ; renvoie False s'il n'existait pas."""
+    try:
+        os.unlink(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def save_upload_meta(chat_upload_folder, file_id, ext, digest, thumb=None):
+    """
+    Persiste les métadonnées du fichier à côté de lui (`<file_id>.meta`).
+
+    L'extension permet de le supprimer sans tester chaque extension autorisée,
+    le hash de contenu (aussi utilisé comme ETag) de le servir sans re-hasher,
+    `thumb` ([pack, position, taille]) de servir sa miniature depuis son pack.
+    """
+    meta = {'ext': ext, 'digest': digest}
+    if thumb is not None:
+        meta['thumb'] = thumb
+
+    meta_path = os.path.join(chat_upload_folder, f"{file_id}.meta")
+    with open(f"{meta_path}.part", 'w') as f:
+        json.dump(meta, f)
+    os.replace(f"{meta_path}.part", meta_path)
+
+
+def load_upload_meta(chat_upload_folder, file_id):
+    """Lit les métadonnées d'un fichier uploadé (None si absentes)."""
+    try:
+        with open(os.path.join(chat_upload_folder, f"{file_id}.meta")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def parse_upload_path(filename):
+    """Renvoie (identifiant du fichier, True s'il s'agit de sa miniature) pour un chemin servi."""
+    file_id = os.path.basename(filename).split('.', 1)[0]
+    if file_id.endswith('_thumb'):
+        return file_id[:-len('_thumb')], True
+    return file_id, False
+
+
+def is_public_upload_path(filename):
+    """
+    Vrai pour un fichier publié (`<file_id>.<ext>`) ou une miniature (`thumbs/<file_id>_thumb.<ext>`).
+
+    Le journal, les métadonnées, les packs, les uploads en cours (`cas/incoming`)
+    et le stockage par contenu ne sont jamais servis.
+    """
+    match = PUBLIC_UPLOAD_PATH.fullmatch(filename)
+    if match is None:
+        return False
+    if filename.startswith('thumbs/'):
+        # Miniatures JPEG, ou au format de l'image pour les plus anciennes
+        return bool(match['thumb']) and match['ext'] in ALLOWED_IMAGE_EXTENSIONS
+    return not match['thumb'] and match['ext'] in ALL_UPLOAD_EXTENSIONS
+
+
+def get_upload_etag(meta, is_thumbnail):
+    """
+    ETag d'un fichier uploadé ou de sa miniature, tiré de ses métadonnées.
+
+    La miniature étant dérivée de façon déterministe du fichier source, son ETag
+    est celui de la source suffixé par `-thumb`.
+    """
+    if meta is None:
+        return None
+    return meta['digest'] + ('-thumb' if is_thumbnail else '')
+
+
+def get_content_blob_path(chat_upload_folder, digest, ext):
+    """Chemin du contenu stocké par adressage de contenu : `cas/<digest[:2]>/<digest>.<ext>`."""
+    return os.path.join(chat_upload_folder, 'cas', digest[:2], f"{digest}.{ext}")
+
+
+def store_content_addressed(chat_upload_folder, temp_path, digest, ext, file_path):
+    """
+    Range le fichier uploadé dans le stockage par contenu et le publie sous `file_path`.
+
+    Si le même contenu a déjà été uploadé, le contenu existant est réutilisé : la
+    publication n'est qu'un lien physique, et le fichier temporaire n'est supprimé
+    qu'une fois ce lien créé.
+
+    Le contenu pouvant être libéré à tout moment par une suppression concurrente
+    (`release_content_blob`), rien n'est vérifié avant d'agir : un lien qui échoue
+    fait ranger le fichier reçu à la place. Celui-ci est publié avant d'être rangé,
+    si bien qu'il n'est jamais seul lien vers son contenu et ne peut pas être libéré
+    entre-temps.
+    """
+    blob_path = get_content_blob_path(chat_upload_folder, digest, ext)
+    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+
+    try:
+        os.link(blob_path, file_path)
+    except FileNotFoundError:
+        # Contenu jamais uploadé, ou libéré entre-temps
+        os.link(temp_path, file_path)
+        os.replace(temp_path, blob_path)
+    else:
+        remove_file(temp_path)
+
+
+def release_content_blob(chat_upload_folder, digest, ext):
+    """Supprime le contenu stocké quand plus aucun fichier publié n'y est lié."""
+    blob_path = get_content_blob_path(chat_upload_folder, digest, ext)
+    try:
+        if os.stat(blob_path).st_nlink == 1:
+            remove_file(blob_path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_upload(chat_upload_folder, file_id, ext, digest=None):
+    """
+    Supprime un fichier publié avec sa miniature et ses métadonnées.
+
+    Avec son hash, le contenu stocké est aussi libéré s'il n'est plus référencé.
+    Sans hash (fichier uploadé avant les métadonnées), la miniature peut encore
+    porter l'extension de l'image (`<file_id>_thumb.<ext>`) : elle est supprimée aussi.
+    """
+    deleted = remove_file(os.path.join(chat_upload_folder, f"{file_id}.{ext}"))
+    if deleted:
+        if digest:
+            release_content_blob(chat_upload_folder, digest, ext)
+        else:
+            remove_file(os.path.join(chat_upload_folder, 'thumbs', f"{file_id}_thumb.{ext}"))
+        remove_file(os.path.join(chat_upload_folder, 'thumbs', f"{file_id}_thumb.jpg"))
+        remove_file(os.path.join(chat_upload_folder, f"{file_id}.meta"))
+    return deleted
+
+
+def get_alloc_key(file_id):
+    """Clé d'un fichier dans le journal d'allocation (None si l'identifiant n'en a pas la forme)."""
+    key = file_id[len('file_'):]
+    if not file_id.startswith('file_') or len(key) != 12 or not key.isascii():
+        return None
+    return key.encode('ascii')
+
+
+@contextmanager
+def locked_alloc_log(chat_upload_folder):
+    """
+    Ouvre le journal d'allocation sous verrou exclusif.
+
+    `flock` sérialise les threads comme les autres workers : les écritures sont
+    brèves (un enregistrement), seul le compactage horaire le garde plus longtemps.
+    """
+    fd = os.open(os.path.join(chat_upload_folder, ALLOC_LOG_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield fd
+    finally:
+        os.close(fd)  # Libère aussi le verrou
+
+
+def append_alloc_record(chat_upload_folder, file_id, ext):
+    """Ajoute en fin de journal l'enregistrement d'un fichier publié."""
+    record = ALLOC_RECORD.pack(
+        get_alloc_key(file_id), ALLOC_EXTENSIONS.index(ext), 0, 0, int(time.time()), 0, 0
+    )
+    with locked_alloc_log(chat_upload_folder) as fd:
+        os.lseek(fd, 0, os.SEEK_END)
+        os.write(fd, record)
+
+
+def find_alloc_record(log, key):
+    """Position de l'enregistrement non supprimé de `key` dans le journal mappé (-1 si absent)."""
+    offset = log.find(key)
+    while offset != -1:
+        # Ne retenir que les correspondances alignées sur un enregistrement complet
+        if offset % ALLOC_RECORD.size == 0 and offset + ALLOC_RECORD.size <= len(log):
+            if not log[offset + ALLOC_FLAGS_OFFSET] & ALLOC_DELETED:
+                return offset
+        offset = log.find(key, offset + 1)
+    return -1
+
+
+def mark_alloc_deleted(chat_upload_folder, file_id):
+    """Marque supprimé l'enregistrement d'un fichier : le nettoyage l'ignorera."""
+    key = get_alloc_key(file_id)
+    if key is None:
+        return False
+
+    with locked_alloc_log(chat_upload_folder) as fd:
+        size = os.fstat(fd).st_size
+        if size < ALLOC_RECORD.size:
+            return False
+
+        with mmap.mmap(fd, size) as log:
+            offset = find_alloc_record(log, key)
+            if offset == -1:
+                return False
+            log[offset + ALLOC_FLAGS_OFFSET] |= ALLOC_DELETED
+            return True
+
+
+def get_thumb_pack_path(chat_upload_folder, segment):
+    """Chemin d'un pack de miniatures : `thumbs/packs/<numéro>.pack`."""
+    return os.path.join(chat_upload_folder, 'thumbs', 'packs', f"{segment:05d}.pack")
+
+
+def list_thumb_pack_segments(chat_upload_folder):
+    """Numéros des packs de miniatures existants."""
+    try:
+        with os.scandir(os.path.join(chat_upload_folder, 'thumbs', 'packs')) as entries:
+            return [int(entry.name[:-len('.pack')]) for entry in entries if entry.name.endswith('.pack')]
+    except FileNotFoundError:
+        return []
+
+
+def store_thumbnail(chat_upload_folder, file_id, data):
+    """
+    Range une miniature, sous le verrou du journal et seulement si son fichier est
+    encore référencé.
+
+    Une miniature de moins de 64 KB est ajoutée à la fin du pack courant (allocation
+    par simple avancée) : des milliers de petites miniatures tiennent ainsi dans
+    quelques fichiers, gardés entiers en cache de pages. Sa position est reportée
+    dans le journal (pour le nettoyage) et dans les métadonnées (pour la servir).
+    Au-delà, elle est écrite sous un nom temporaire puis renommée.
+
+    La suppression marque l'enregistrement avant de retirer les fichiers : une
+    miniature n'est donc jamais écrite après que son fichier a été supprimé.
+
+    Returns:
+        True si la miniature a été rangée, False si le fichier n'est plus référencé
+    """
+    key = get_alloc_key(file_id)
+    if key is None:
+        return False
+    thumbs_folder = os.path.join(chat_upload_folder, 'thumbs')
+    os.makedirs(os.path.join(thumbs_folder, 'packs'), exist_ok=True)
+
+    with locked_alloc_log(chat_upload_folder) as log_fd:
+        size = os.fstat(log_fd).st_size
+        meta = load_upload_meta(chat_upload_folder, file_id)
+        if size < ALLOC_RECORD.size or meta is None:
+            return False
+
+        with mmap.mmap(log_fd, size) as log:
+            record_offset = find_alloc_record(log, key)
+            if record_offset == -1:
+                return False
+
+            if len(data) > THUMB_PACK_MAX_SIZE:
+                thumb_path = os.path.join(thumbs_folder, f"{file_id}_thumb.jpg")
+                partial_path = f"{thumb_path}.part"
+                with open(partial_path, 'wb') as f:
+                    f.write(data)
+                os.replace(partial_path, thumb_path)
+                return True
+
+            segment = max(list_thumb_pack_segments(chat_upload_folder), default=0)
+            pack_fd = os.open(get_thumb_pack_path(chat_upload_folder, segment), os.O_WRONLY | os.O_CREAT, 0o644)
+            try:
+                offset = os.lseek(pack_fd, 0, os.SEEK_END)
+                if offset and offset + len(data) > THUMB_PACK_SEGMENT_SIZE:
+                    # Pack plein : les suivants iront dans un nouveau pack
+                    os.close(pack_fd)
+                    segment += 1
+                    pack_fd = os.open(get_thumb_pack_path(chat_upload_folder, segment), os.O_WRONLY | os.O_CREAT, 0o644)
+                    offset = 0
+                os.pwrite(pack_fd, data, offset)
+            finally:
+                os.close(pack_fd)
+
+            record = list(ALLOC_RECORD.unpack_from(log, record_offset))
+            record[3], record[5], record[6] = segment, offset, len(data)
+            ALLOC_RECORD.pack_into(log, record_offset, *record)
+
+        save_upload_meta(chat_upload_folder, file_id, meta['ext'], meta['digest'],
+                         thumb=[segment, offset, len(data)])
+
+    return True
+
+
+def read_packed_thumbnail(chat_upload_folder, thumb):
+    """Lit une miniature dans son pack, via un mmap conservé par le processus."""
+    segment, offset, length = thumb
+    path = get_thumb_pack_path(chat_upload_folder, segment)
+
+    with _thumb_packs_lock:
+        pack = _thumb_packs.get(path)
+        if pack is None or offset + length > len(pack):
+            # Pack pas encore mappé, ou agrandi depuis
+            with open(path, 'rb') as f:
+                remapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if pack is not None:
+                pack.close()
+            _thumb_packs[path] = pack = remapped
+        return pack[offset:offset + length]
+
+
+def release_deleted_thumb_packs():
+    """Libère les mmaps des packs supprimés par le nettoyage (ici ou dans un autre worker)."""
+    with _thumb_packs_lock:
+        for path in [path for path in _thumb_packs if not os.path.exists(path)]:
+            _thumb_packs.pop(path).close()
+
+
+def cleanup_expired_uploads(chat_upload_folder, ttl):
+    """
+    Compacte le journal d'allocation et supprime en une passe les uploads plus
+    anciens que `ttl` secondes (aucun si `ttl` vaut 0).
+
+    Le journal est parcouru via mmap, sans lister le dossier : les enregistrements
+    encore valides sont recopiés en tête et le journal est tronqué derrière eux
+    (remise à zéro du curseur d'écriture), ce qui en retire les fichiers supprimés.
+    Les packs de miniatures qui ne sont plus référencés sont supprimés en bloc, les
+    fichiers expirés une fois le verrou relâché.
+
+    Returns:
+        Nombre de fichiers supprimés
+    """
+    if not os.path.exists(os.path.join(chat_upload_folder, ALLOC_LOG_NAME)):
+        return 0
+
+    expires_before = time.time() - ttl if ttl else None
+    expired = []
+    live_segments = set()
+
+    with locked_alloc_log(chat_upload_folder) as fd:
+        size = os.fstat(fd).st_size
+        size -= size % ALLOC_RECORD.size  # Enregistrement incomplet en fin de journal
+        if size == 0:
+            return 0
+
+        write_offset = 0
+        with mmap.mmap(fd, size) as log:
+            for offset in range(0, size, ALLOC_RECORD.size):
+                key, ext_index, flags, segment, uploaded_at, _, thumb_length = ALLOC_RECORD.unpack_from(log, offset)
+                if flags & ALLOC_DELETED:
+                    continue
+                if expires_before is not None and uploaded_at < expires_before:
+                    expired.append((f"file_{key.decode('ascii')}", ALLOC_EXTENSIONS[ext_index]))
+                    continue
+
+                if thumb_length:
+                    live_segments.add(segment)
+
+                if write_offset != offset:
+                    log[write_offset:write_offset + ALLOC_RECORD.size] = log[offset:offset + ALLOC_RECORD.size]
+                write_offset += ALLOC_RECORD.size
+
+        os.ftruncate(fd, write_offset)
+
+        # Le pack courant reste ouvert aux nouvelles miniatures
+        segments = list_thumb_pack_segments(chat_upload_folder)
+        for segment in segments:
+            if segment not in live_segments and segment != max(segments):
+                remove_file(get_thumb_pack_path(chat_upload_folder, segment))
+
+    removed = 0
+    for file_id, ext in expired:
+        meta = load_upload_meta(chat_upload_folder, file_id)
+        if remove_upload(chat_upload_folder, file_id, ext, meta and meta['digest']):
+            removed += 1
+    return removed
+
+
+def schedule_upload_cleanup(app):
+    """
+    Programme le prochain nettoyage des uploads.
+
+    Chaque worker a son minuteur ; le verrou du journal évite qu'ils se chevauchent.
+    Le journal est compacté à chaque passage (il ne grossit qu'avec les uploads
+    vivants). L'expiration est désactivée par défaut, les uploads étant les pièces
+    jointes de l'historique du chat : `CHAT_UPLOADS_TTL` (secondes) l'active.
+    """
+    def run():
+        with app.app_context():
+            try:
+                ttl = current_app.config.get('CHAT_UPLOADS_TTL', UPLOAD_TTL)
+                removed = cleanup_expired_uploads(get_chat_upload_folder(), ttl)
+                if removed:
+                    current_app.logger.info(f"Uploads expirés supprimés: {removed}")
+                release_deleted_thumb_packs()
+            except Exception as e:
+                current_app.logger.error(f"Erreur nettoyage uploads: {str(e)}")
+        schedule_upload_cleanup(app)
+
+    timer = threading.Timer(UPLOAD_CLEANUP_INTERVAL, run)
+    timer.daemon = True
+    timer.start()
+
+
+@chat_media_bp.record_once
+def start_upload_cleanup(state):
+    """Démarre le nettoyage périodique à l'enregistrement du blueprint."""
+    schedule_upload_cleanup(state.app)
+
+
+def get_transcription_jobs_folder():
+    """Dossier des transcriptions asynchrones, partagé par tous les workers."""
+    return os.path.join(get_chat_upload_folder(), '_jobs')
+
+
+def write_transcription_job(job_path, job):
+    """Écrit l'état d'un job (remplacement atomique : jamais lu à moitié écrit)."""
+    with open(f"{job_path}.part", 'w') as f:
+        json.dump(job, f)
+    os.replace(f"{job_path}.part", job_path)
+
+
+def register_transcription_job(future, language):
+    """
+    Enregistre une transcription en cours et renvoie son identifiant.
+
+    L'état du job est un fichier `_jobs/<job_id>.json`, réécrit à la fin de la
+    transcription : le GET de suivi peut atteindre n'importe quel worker.
+    """
+    jobs_folder = get_transcription_jobs_folder()
+    os.makedirs(jobs_folder, exist_ok=True)
+    job_id = f"job_{uuid.uuid4().hex[:12]}"
+    job_path = os.path.join(jobs_folder, f"{job_id}.json")
+    logger = current_app.logger
+
+    # Purger les résultats jamais récupérés (et les jobs d'un worker arrêté)
+    expires_before = time.time() - TRANSCRIPTION_JOB_TTL
+    with os.scandir(jobs_folder) as entries:
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime < expires_before:
+                    remove_file(entry.path)
+            except FileNotFoundError:
+                pass
+
+    write_transcription_job(job_path, {'success': True, 'status': 'pending'})
+
+    def on_done(done):
+        try:
+            job = transcription_response(done.result(), language)
+        except Exception as e:
+            logger.error(f"Erreur transcription: {str(e)}")
+            job = {
+                'success': False,
+                'status': 'error',
+                'error': f'Erreur lors de la transcription: {str(e)}'
+            }
+        write_transcription_job(job_path, job)
+
+    future.add_done_callback(on_done)
+    return job_id
+
+
+def transcription_response(result, language):
+    """Corps JSON d'une transcription terminée."""
+    return {
+        'success': True,
+        'status': 'done',
+        'text': result['text'],
+        'duration': result['duration'],
+        'language': language
+    }
+
+
+def submit_media_task(fn, *args):
+    """
+    Soumet un traitement d'upload en tâche de fond, avec le contexte applicatif (config, logger).
+
+    Personne n'attend le Future : une exception du traitement est journalisée ici
+    plutôt que perdue avec lui.
+    """
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            return fn(*args)
+
+    def on_done(future):
+        error = future.exception()
+        if error is not None:
+            app.logger.error(f"Erreur traitement {fn.__name__}: {error!r}")
+
+    future = _media_executor.submit(run)
+    future.add_done_callback(on_done)
+    return future
 
-    if ext in ALLOWED_AUDIO_EXTENSIONS:
-        return 'audio'
-    elif ext in ALLOWED_IMAGE_EXTENSIONS:
-        return 'image'
-    elif ext in ALLOWED_DOCUMENT_EXTENSIONS:
-        return 'document'
-    return 'unknown'
+
+def build_thumbnail_url(file_id):
+    """URL (déterministe) de la miniature d'une image, qu'elle soit prête ou non."""
+    return f"{request.host_url.rstrip('/')}/uploads/chat/thumbs/{file_id}_thumb.jpg"
+
+
+def get_thumbnail_url(chat_upload_folder, file_id, meta):
+    """URL de la miniature si elle est prête (dans un pack ou en fichier séparé), sinon None."""
+    if 'thumb' not in meta and not os.path.exists(
+        os.path.join(chat_upload_folder, 'thumbs', f"{file_id}_thumb.jpg")
+    ):
+        return None
+    return build_thumbnail_url(file_id)
+
+
+def submit_transcription(fn, *args):
+    """
+    Exécute `fn(*args)` sur l'exécuteur borné des transcriptions, avec le contexte
+    applicatif (config, logger), et renvoie son Future.
+
+    Sans place libre, TranscriptionBusy est levée plutôt que de mettre la tâche en
+    file : l'audio relayé en direct ne peut pas attendre qu'un thread se libère.
+    """
+    if not _transcription_slots.acquire(blocking=False):
+        raise TranscriptionBusy('Trop de transcriptions en cours, réessayez dans un instant')
+
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            return fn(*args)
+
+    future = _transcription_executor.submit(run)
+    future.add_done_callback(lambda _: _transcription_slots.release())
+    return future
+
+
+def probe_audio_duration(path):
+    """Durée de l'audio en secondes via ffprobe (None si indisponible)."""
+    try:
+        result = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+             '-of', 'default=noprint_wrappers=1:nokey=1', path],
+            capture_output=True, text=True, check=True
+        )
+        return float(result.stdout.strip())
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+
+
+def get_window_offsets(duration):
+    """Débuts (s) des fenêtres de 30 s se recouvrant de 2 s (stratégie de Whisper)."""
+    step = AUDIO_CHUNK_SECONDS - AUDIO_CHUNK_OVERLAP
+    offsets = [0]
+    while offsets[-1] + AUDIO_CHUNK_SECONDS < duration:
+        offsets.append(offsets[-1] + step)
+    return offsets
+
+
+class PipeReader:
+    """
+    Sortie d'un processus exposée comme fichier, sans `fileno()`.
+
+    httpx déduit la taille d'un fichier de `fstat`, qui vaut 0 pour un pipe : sans
+    descripteur visible, le corps est envoyé en chunked au fil de la lecture.
+    `eof` indique que le processus a fermé sa sortie (flux lu en entier).
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.eof = False
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        if not data and size != 0:
+            self.eof = True
+        return data
+
+
+def request_transcription(client, file, language):
+    """Appel Whisper avec les segments horodatés."""
+    return client.audio.transcriptions.create(
+        model="whisper-1",
+        file=file,
+        language=language,
+        response_format="verbose_json",
+        timestamp_granularities=['segment']
+    )
+
+
+def transcribe_chunk(client, path, language, filename=None):
+    """Appel Whisper sur un fichier audio (`filename` : nom annoncé, dont l'extension donne le format)."""
+    with open(path, 'rb') as audio:
+        return request_transcription(client, (filename, audio) if filename else audio, language)
+
+
+def transcribe_transcoded(client, path, language, filename):
+    """
+    Appel Whisper sur l'audio transcodé à la volée par ffmpeg.
+
+    Le flux Opus est relayé directement depuis la sortie de ffmpeg : un m4a de
+    plusieurs MB devient quelques centaines de KB envoyés à OpenAI. Si ffmpeg
+    est introuvable ou échoue (le flux envoyé est alors tronqué ou vide), le
+    fichier d'origine est envoyé tel quel.
+
+    Si Whisper refuse la requête avant d'avoir lu tout le flux (429, 401, connexion
+    coupée), ffmpeg meurt du pipe fermé : ce n'est pas un échec du transcodage,
+    et l'erreur de l'API est relevée sans second envoi.
+    """
+    with tempfile.TemporaryFile() as ffmpeg_errors:
+        try:
+            process = subprocess.Popen(
+                ['ffmpeg', '-v', 'error', '-i', path, *WHISPER_AUDIO_ARGS, '-f', 'ogg', 'pipe:1'],
+                stdout=subprocess.PIPE,
+                stderr=ffmpeg_errors
+            )
+        except OSError as e:
+            current_app.logger.warning(f"ffmpeg indisponible, audio envoyé tel quel: {str(e)}")
+            return transcribe_chunk(client, path, language, filename)
+
+        reader = PipeReader(process.stdout)
+        error = None
+        try:
+            file = ('audio.ogg', reader, 'audio/ogg')
+            transcript = request_transcription(client.with_options(max_retries=0), file, language)
+        except Exception as e:
+            error = e
+        finally:
+            process.stdout.close()
+            process.wait()
+
+        # Sans erreur de Whisper, ou flux lu jusqu'au bout : ffmpeg a échoué seul
+        if process.returncode != 0 and (error is None or reader.eof):
+            ffmpeg_errors.seek(0)
+            message = ffmpeg_errors.read().decode(errors='replace').strip()
+            current_app.logger.warning(
+                f"Échec du transcodage ({process.returncode}), audio envoyé tel quel: {message}"
+            )
+            return transcribe_chunk(client, path, language, filename)
+
+    if error is not None:
+        raise error
+    return transcript
+
+
+def transcribe_window(client, path, offset, chunk_folder, language):
+    """Extrait une fenêtre transcodée en Opus 16 kHz mono puis la transcrit."""
+    chunk_path = os.path.join(chunk_folder, f"chunk_{offset:06d}.ogg")
+    subprocess.run(
+        ['ffmpeg', '-v', 'error', '-ss', str(offset), '-t', str(AUDIO_CHUNK_SECONDS),
+         '-i', path, *WHISPER_AUDIO_ARGS, chunk_path],
+        check=True
+    )
+    return transcribe_chunk(client, chunk_path, language)
+
+
+def merge_chunk_transcripts(chunk_transcripts):
+    """
+    Recolle les segments des fenêtres dans l'ordre chronologique.
+
+    Les segments d'une fenêtre qui commencent dans la zone déjà couverte par la
+    précédente et dont le texte est quasi identique à un segment retenu sont
+    des doublons du recouvrement : ils sont ignorés.
+    """
+    merged = []  # (début, fin, texte)
+
+    for offset, transcript in chunk_transcripts:
+        for segment in transcript.segments or []:
+            start = offset + segment.start
+            end = offset + segment.end
+            text = segment.text.strip()
+
+            if merged and start < merged[-1][1] and any(
+                SequenceMatcher(None, text, previous).ratio() > 0.8
+                for _, _, previous in merged[-3:]
+            ):
+                continue
+
+            merged.append((start, end, text))
+
+    return ' '.join(text for _, _, text in merged)
+
+
+def transcribe_audio_file(client, path, language, filename):
+    """
+    Transcrit un fichier audio sur disque.
+
+    L'audio est transcodé en Opus 16 kHz mono avant l'envoi. Au-delà de 60 s, il est
+    découpé localement et les fenêtres sont envoyées en parallèle à Whisper plutôt
+    que traitées séquentiellement côté OpenAI. Sans ffmpeg, ou si le transcodage
+    échoue, le fichier est envoyé tel quel.
+    """
+    duration = probe_audio_duration(path)
+
+    if duration is None or duration <= LONG_AUDIO_MIN_DURATION:
+        if duration is None:
+            transcript = transcribe_chunk(client, path, language, filename)
+        else:
+            transcript = transcribe_transcoded(client, path, language, filename)
+        return {
+            'text': transcript.text,
+            'duration': getattr(transcript, 'duration', duration)
+        }
+
+    # Chaque fenêtre est extraite puis transcrite dans la même tâche : les premiers
+    # appels Whisper partent sans attendre l'encodage des fenêtres suivantes
+    offsets = get_window_offsets(duration)
+    with tempfile.TemporaryDirectory(prefix='audio_chunks_') as chunk_folder:
+        transcripts = _whisper_chunk_executor.map(
+            lambda offset: transcribe_window(client, path, offset, chunk_folder, language),
+            offsets
+        )
+        chunk_transcripts = list(zip(offsets, transcripts))
+
+    return {
+        'text': merge_chunk_transcripts(chunk_transcripts),
+        'duration': duration
+    }
+
+
+def transcribe_spooled_audio(client, audio_target, language):
+    """
+    Tâche de fond : transcrit l'audio écrit sur disque puis supprime le fichier temporaire.
+
+    Un audio déjà transcrit dans la même langue (même hash de contenu) n'est pas
+    renvoyé à Whisper.
+    """
+    key = ('transcription', audio_target.digest, language)
+    try:
+        result = get_cached_result(key)
+        if result is None:
+            result = transcribe_audio_file(client, audio_target.path, language, f"audio.{audio_target.ext}")
+            cache_result(key, result)
+        return result
+    finally:
+        audio_target.discard()
+
+
+def check_content_length(max_size):
+    """
+    Refuse la requête d'après son `Content-Length`, avant toute lecture du corps.
+
+    Returns:
+        Réponse d'erreur (411 / 413), ou None si la taille déclarée est acceptable
+    """
+    declared = request.content_length
+    if declared is None:
+        return jsonify({
+            'success': False,
+            'error': 'En-tête Content-Length requis'
+        }), 411
+    if declared > max_size + MULTIPART_OVERHEAD:
+        return jsonify({
+            'success': False,
+            'error': f'Fichier trop volumineux. Maximum: {max_size // (1024*1024)} MB'
+        }), 413
+    return None
+
+
+def stream_multipart(targets):
+    """
+    Parse le corps multipart de la requête au fil de l'eau.
+
+    Contrairement à `request.files`, rien n'est spoolé par Werkzeug : chaque bloc lu
+    sur le socket est transmis directement aux cibles enregistrées.
+    """
+    parser = StreamingFormDataParser(headers=request.headers)
+    for name, target in targets.items():
+        parser.register(name, target)
+
+    while True:
+        chunk = request.stream.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            break
+        parser.data_received(chunk)
 
 
 # =============================================================================
@@ -76,84 +1332,119 @@ def transcribe_audio():
 
     Request:
         - Content-Type: multipart/form-data
+        - language (optionnel): code langue ISO (ex: 'fr', 'en'), de préférence
+          avant `audio` dans le corps ou en paramètre d'URL `?language=` (placé
+          après, l'audio est d'abord écrit sur disque au lieu d'être relayé)
         - audio: fichier audio (m4a, mp3, wav, webm, ogg, flac)
-        - language (optionnel): code langue ISO (ex: 'fr', 'en')
+        - async (paramètre d'URL, optionnel): `?async=1` pour ne pas attendre Whisper
 
     Response:
         {
             "success": true,
+            "status": "done",
             "text": "Texte transcrit...",
             "duration": 5.2,
             "language": "fr"
         }
+
+    Response (`?async=1`, 202) — résultat à récupérer via GET /transcribe/<job_id>:
+        {
+            "success": true,
+            "status": "pending",
+            "jobId": "job_abc123"
+        }
     """
     try:
-        # Vérifier la présence du fichier audio
-        if 'audio' not in request.files:
+        # Vérifier la présence d'un corps multipart
+        if request.mimetype != 'multipart/form-data':
             return jsonify({
                 'success': False,
                 'error': 'Aucun fichier audio fourni'
             }), 400
 
-        audio_file = request.files['audio']
+        error_response = check_content_length(MAX_AUDIO_SIZE)
+        if error_response:
+            return error_response
+
+        language_target = LanguageTarget()
+        default_language = request.args.get('language', 'fr')  # Français par défaut
+
+        # Audio court : relayé vers Whisper pendant sa réception (langue connue avant).
+        # Audio long : écrit sur disque pour pouvoir être découpé par ffmpeg.
+        spooled = request.content_length > STREAMING_AUDIO_MAX_BYTES
+        if spooled:
+            audio_target = SpooledAudioTarget(
+                ALLOWED_AUDIO_EXTENSIONS,
+                MAX_AUDIO_SIZE,
+                AUDIO_FORMAT_ERROR
+            )
+        else:
+            audio_target = WhisperStreamTarget(
+                ALLOWED_AUDIO_EXTENSIONS,
+                MAX_AUDIO_SIZE,
+                AUDIO_FORMAT_ERROR,
+                language_target,
+                default_language,
+                'language' in request.args
+            )
 
-        if audio_file.filename == '':
+        try:
+            stream_multipart({'language': language_target, 'audio': audio_target})
+        except UploadError as e:
+            audio_target.discard()
             return jsonify({
                 'success': False,
-                'error': 'Nom de fichier vide'
+                'error': str(e)
             }), 400
-
-        # Vérifier l'extension
-        if not allowed_file(audio_file.filename, ALLOWED_AUDIO_EXTENSIONS):
+        except TranscriptionBusy as e:
+            audio_target.discard()
             return jsonify({
                 'success': False,
-                'error': f'Format audio non supporté. Formats acceptés: {", ".join(ALLOWED_AUDIO_EXTENSIONS)}'
-            }), 400
-
-        # Vérifier la taille
-        audio_file.seek(0, 2)  # Aller à la fin
-        file_size = audio_file.tell()
-        audio_file.seek(0)  # Revenir au début
-
-        if file_size > MAX_AUDIO_SIZE:
+                'error': str(e)
+            }), 503
+        except Exception:
+            audio_target.discard()
+            raise
+
+        if not audio_target.complete:
+            audio_target.discard()
             return jsonify({
                 'success': False,
-                'error': f'Fichier trop volumineux. Maximum: {MAX_AUDIO_SIZE // (1024*1024)} MB'
+                'error': 'Aucun fichier audio fourni'
             }), 400
 
-        # Paramètres optionnels
-        language = request.form.get('language', 'fr')  # Français par défaut
-
-        # Sauvegarder temporairement le fichier
-        ext = audio_file.filename.rsplit('.', 1)[1].lower()
-        temp_filename = f"audio_{uuid.uuid4().hex}.{ext}"
-        temp_path = os.path.join(tempfile.gettempdir(), temp_filename)
-
-        try:
-            audio_file.save(temp_path)
-
-            # Appeler l'API Whisper
-            client = get_openai_client()
-
-            with open(temp_path, 'rb') as audio:
-                transcript = client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio,
-                    language=language,
-                    response_format="verbose_json"
-                )
+        # Langue reçue après l'audio : il a été écrit sur disque plutôt que relayé
+        spooled = spooled or audio_target.spooled
+        if spooled:
+            try:
+                client = get_openai_client()
+            except ValueError:
+                audio_target.discard()
+                raise
+            language = language_target.value.decode('utf-8') or default_language
+            try:
+                future = submit_transcription(transcribe_spooled_audio, client, audio_target, language)
+            except TranscriptionBusy as e:
+                audio_target.discard()
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 503
+        else:
+            language = audio_target.language
+            future = audio_target.future
 
+        # Mode asynchrone : le worker est libéré sans attendre la réponse de Whisper
+        if request.args.get('async') in ('1', 'true'):
+            job_id = register_transcription_job(future, language)
             return jsonify({
                 'success': True,
-                'text': transcript.text,
-                'duration': getattr(transcript, 'duration', None),
-                'language': language
-            })
+                'status': 'pending',
+                'jobId': job_id
+            }), 202
 
-        finally:
-            # Nettoyer le fichier temporaire
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+        # Attendre la fin de la transcription
+        return jsonify(transcription_response(future.result(), language))
 
     except ValueError as e:
         return jsonify({
@@ -168,6 +1459,41 @@ def transcribe_audio():
         }), 500
 
 
+@chat_media_bp.route('/transcribe/<job_id>', methods=['GET'])
+def get_transcription(job_id):
+    """
+    Récupère le résultat d'une transcription lancée avec `?async=1`.
+
+    Response:
+        - 202 {"success": true, "status": "pending"} tant que Whisper n'a pas répondu
+        - 200 avec le même corps que POST /transcribe une fois terminée
+    """
+    job = None
+    if TRANSCRIPTION_JOB_ID.fullmatch(job_id):
+        job_path = os.path.join(get_transcription_jobs_folder(), f"{job_id}.json")
+        try:
+            with open(job_path) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Transcription introuvable'
+        }), 404
+
+    if job['status'] == 'pending':
+        return jsonify(job), 202
+
+    # Résultat remis une seule fois
+    remove_file(job_path)
+
+    if job['status'] == 'error':
+        return jsonify(job), 500
+    return jsonify(job)
+
+
 # =============================================================================
 # ROUTE: Upload de Fichiers
 # =============================================================================
@@ -182,6 +1508,10 @@ def upload_file():
         - file: le fichier à uploader
         - user_id (optionnel): ID de l'utilisateur
 
+    La miniature des images est générée en tâche de fond : `thumbnailURL` est déjà
+    renseignée mais `thumbnailStatus` vaut "pending" et l'URL répond 404 tant que la
+    miniature n'est pas prête (le client réessaie, ou interroge GET /files/<file_id>).
+
     Response:
         {
             "success": true,
@@ -190,93 +1520,97 @@ def upload_file():
                 "type": "image",
                 "fileName": "photo.jpg",
                 "fileURL": "/uploads/chat/...",
-                "thumbnailURL": "/uploads/chat/thumbs/...",
+                "thumbnailURL": "/uploads/chat/thumbs/file_abc123_thumb.jpg",
+                "thumbnailStatus": "pending",
                 "fileSize": 123456,
-                "mimeType": "image/jpeg"
+                "mimeType": "image/jpeg",
+                "etag": "9f86d081884c7d65..."
             }
         }
     """
     try:
-        if 'file' not in request.files:
+        if request.mimetype != 'multipart/form-data':
             return jsonify({
                 'success': False,
                 'error': 'Aucun fichier fourni'
             }), 400
 
-        uploaded_file = request.files['file']
+        error_response = check_content_length(MAX_FILE_SIZE)
+        if error_response:
+            return error_response
 
-        if uploaded_file.filename == '':
-            return jsonify({
-                'success': False,
-                'error': 'Nom de fichier vide'
-            }), 400
+        # Créer les dossiers d'upload si nécessaire
+        chat_upload_folder = get_chat_upload_folder()
+        incoming_folder = os.path.join(chat_upload_folder, 'cas', 'incoming')
+        os.makedirs(incoming_folder, exist_ok=True)
+
+        # Le fichier est écrit et hashé en une passe, puis rangé selon son contenu
+        file_target = UploadTarget(
+            incoming_folder,
+            ALL_UPLOAD_EXTENSIONS,
+            MAX_FILE_SIZE,
+            UPLOAD_FORMAT_ERROR,
+            ALLOWED_UPLOAD_MIMES
+        )
 
-        # Vérifier le type de fichier
-        all_allowed = ALLOWED_IMAGE_EXTENSIONS | ALLOWED_DOCUMENT_EXTENSIONS
-        if not allowed_file(uploaded_file.filename, all_allowed):
+        try:
+            stream_multipart({'file': file_target})
+        except UploadError as e:
+            file_target.discard()
             return jsonify({
                 'success': False,
-                'error': f'Format non supporté. Formats acceptés: {", ".join(all_allowed)}'
+                'error': str(e)
             }), 400
+        except Exception:
+            file_target.discard()
+            raise
 
-        # Vérifier la taille
-        uploaded_file.seek(0, 2)
-        file_size = uploaded_file.tell()
-        uploaded_file.seek(0)
-
-        if file_size > MAX_FILE_SIZE:
+        if not file_target.complete:
+            file_target.discard()
             return jsonify({
                 'success': False,
-                'error': f'Fichier trop volumineux. Maximum: {MAX_FILE_SIZE // (1024*1024)} MB'
+                'error': 'Aucun fichier fourni'
             }), 400
 
-        # Générer un nom unique
-        original_filename = secure_filename(uploaded_file.filename)
-        ext = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
-        file_id = f"file_{uuid.uuid4().hex[:12]}"
+        file_id = file_target.file_id
+        original_filename = file_target.safe_name
+        ext = file_target.ext
         new_filename = f"{file_id}.{ext}"
+        file_path = os.path.join(chat_upload_folder, new_filename)
+        file_size = file_target.size
+        digest = file_target.digest
 
-        # Déterminer le type
-        file_type = get_file_type(original_filename)
-
-        # Créer le dossier d'upload si nécessaire
-        upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-        chat_upload_folder = os.path.join(upload_folder, 'chat')
-        os.makedirs(chat_upload_folder, exist_ok=True)
+        try:
+            store_content_addressed(chat_upload_folder, file_target.path, digest, ext, file_path)
+        except Exception:
+            file_target.discard()
+            raise
+        save_upload_meta(chat_upload_folder, file_id, ext, digest)
+        append_alloc_record(chat_upload_folder, file_id, ext)
 
-        # Sauvegarder le fichier
-        file_path = os.path.join(chat_upload_folder, new_filename)
-        uploaded_file.save(file_path)
+        # Déterminer le type
+        file_type = get_file_type(ext)
 
         # Construire l'URL
         base_url = request.host_url.rstrip('/')
         file_url = f"{base_url}/uploads/chat/{new_filename}"
 
-        # Créer une miniature pour les images
+        # Créer la miniature des images en tâche de fond (voir GET /files/<file_id>)
         thumbnail_url = None
+        thumbnail_status = None
         if file_type == 'image':
-            thumbnail_url = create_thumbnail(file_path, chat_upload_folder, file_id, ext)
-            if thumbnail_url:
-                thumbnail_url = f"{base_url}/uploads/chat/thumbs/{file_id}_thumb.{ext}"
+            submit_media_task(create_thumbnail, file_path, chat_upload_folder, file_id, ext)
+            thumbnail_url = build_thumbnail_url(file_id)
+            thumbnail_status = 'pending'
 
-        # Extraire le texte pour les PDF (optionnel, pour l'IA)
+        # Extraire le texte pour les PDF (optionnel, pour l'IA), une seule fois par contenu
         extracted_text = None
         if ext == 'pdf':
-            extracted_text = extract_pdf_text(file_path)
-
-        # Déterminer le MIME type
-        mime_types = {
-            'jpg': 'image/jpeg',
-            'jpeg': 'image/jpeg',
-            'png': 'image/png',
-            'gif': 'image/gif',
-            'webp': 'image/webp',
-            'heic': 'image/heic',
-            'pdf': 'application/pdf',
-            'txt': 'text/plain',
-            'md': 'text/markdown'
-        }
-        mime_type = mime_types.get(ext, 'application/octet-stream')
+            extracted_text = get_cached_result(('pdf_text', digest))
+            if extracted_text is None:
+                extracted_text = extract_pdf_text(file_path)
+                if extracted_text is not None:
+                    cache_result(('pdf_text', digest), extracted_text)
 
         response_data = {
             'success': True,
@@ -286,8 +1620,10 @@ def upload_file():
                 'fileName': original_filename,
                 'fileURL': file_url,
                 'thumbnailURL': thumbnail_url,
+                'thumbnailStatus': thumbnail_status,
                 'fileSize': file_size,
-                'mimeType': mime_type
+                'mimeType': file_target.mime,
+                'etag': digest
             }
         }
 
@@ -306,29 +1642,82 @@ def upload_file():
 
 
 def create_thumbnail(image_path, upload_folder, file_id, ext):
-    """Crée une miniature de l'image."""
+    """
+    Crée une miniature JPEG de l'image (max 200x200).
+
+    Exécutée en tâche de fond. Une miniature de moins de 64 KB est ajoutée au pack
+    courant ; au-delà, elle est écrite sous un nom temporaire puis renommée. Elle
+    n'est donc jamais servie incomplète (voir `store_thumbnail`).
+
+    Returns:
+        True si la miniature a été créée (False aussi si le fichier a été supprimé
+        pendant sa création)
+    """
+    data = encode_thumbnail(image_path, ext)
+    if data is None:
+        return False
+
+    return store_thumbnail(upload_folder, file_id, data)
+
+
+def encode_thumbnail(image_path, ext):
+    """
+    Encode la miniature JPEG ; renvoie ses octets, ou None si elle n'a pas pu être créée.
+
+    libvips décode à la demande (shrink-on-load JPEG, HEIC via libheif) : seuls les
+    pixels utiles à la miniature sont décodés. Pillow sert de repli si pyvips
+    n'est pas installé, ou si la bibliothèque système libvips est introuvable.
+    """
     try:
-        from PIL import Image
+        import pyvips
+    except (ImportError, OSError) as e:
+        if isinstance(e, OSError):
+            current_app.logger.warning(f"libvips indisponible, repli sur Pillow: {str(e)}")
+        return encode_thumbnail_pillow(image_path, ext)
 
-        thumbs_folder = os.path.join(upload_folder, 'thumbs')
-        os.makedirs(thumbs_folder, exist_ok=True)
+    try:
+        img = pyvips.Image.thumbnail(image_path, 200, height=200, size='down')
+        if img.hasalpha():
+            img = img.flatten(background=255)
+        return img.jpegsave_buffer(Q=85, strip=True, optimize_coding=True)
 
-        thumb_filename = f"{file_id}_thumb.{ext}"
-        thumb_path = os.path.join(thumbs_folder, thumb_filename)
+    except Exception as e:
+        current_app.logger.error(f"Erreur création miniature: {str(e)}")
+        return None
+
+
+def encode_thumbnail_pillow(image_path, ext):
+    """Encode la miniature JPEG avec Pillow (repli sans libvips)."""
+    try:
+        from PIL import Image
 
         with Image.open(image_path) as img:
-            # Convertir HEIC si nécessaire
-            if img.mode in ('RGBA', 'P'):
-                img = img.convert('RGB')
+            # JPEG : libjpeg décode directement à l'échelle 1/2, 1/4 ou 1/8 (IDCT réduite)
+            if ext in ('jpg', 'jpeg'):
+                img.draft('RGB', (400, 400))
+
+            # Une palette ne se redimensionne qu'au plus proche voisin
+            if img.mode == 'P':
+                img = img.convert('RGBA')
 
-            # Créer la miniature (max 200x200)
+            # Créer la miniature (max 200x200) avant toute conversion
             img.thumbnail((200, 200), Image.Resampling.LANCZOS)
-            img.save(thumb_path, quality=85, optimize=True)
 
-        return thumb_path
+            # Convertir HEIC / transparence sur la miniature uniquement
+            if img.mode in ('RGBA', 'LA'):
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel('A'))
+                img = background
+            elif img.mode != 'RGB':
+                img = img.convert('RGB')
+
+            buffer = io.BytesIO()
+            img.save(buffer, 'JPEG', quality=85, optimize=True)
+
+        return buffer.getvalue()
 
     except ImportError:
-        current_app.logger.warning("Pillow non installé, pas de miniature créée")
+        current_app.logger.warning("Ni pyvips ni Pillow installé, pas de miniature créée")
         return None
     except Exception as e:
         current_app.logger.error(f"Erreur création miniature: {str(e)}")
@@ -336,25 +1725,76 @@ def create_thumbnail(image_path, upload_folder, file_id, ext):
 
 
 def extract_pdf_text(pdf_path):
-    """Extrait le texte d'un fichier PDF."""
+    """Extrait le texte d'un fichier PDF (PDFium, en C++)."""
     try:
-        from PyPDF2 import PdfReader
+        import pypdfium2 as pdfium
 
-        reader = PdfReader(pdf_path)
-        text = ""
-        for page in reader.pages[:10]:  # Limiter à 10 pages
-            text += page.extract_text() + "\n"
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            parts = []
+            for index in range(min(10, len(pdf))):  # Limiter à 10 pages
+                page = pdf[index]
+                textpage = page.get_textpage()
+                parts.append(textpage.get_text_range())
+                textpage.close()
+                page.close()
+        finally:
+            pdf.close()
 
-        return text.strip()
+        return "\n".join(parts).strip()
 
     except ImportError:
-        current_app.logger.warning("PyPDF2 non installé, pas d'extraction PDF")
+        current_app.logger.warning("pypdfium2 non installé, pas d'extraction PDF")
         return None
     except Exception as e:
         current_app.logger.error(f"Erreur extraction PDF: {str(e)}")
         return None
 
 
+# =============================================================================
+# ROUTE: État d'un Fichier
+# =============================================================================
+
+@chat_media_bp.route('/files/<file_id>', methods=['GET'])
+def get_file_status(file_id):
+    """
+    Renvoie l'état des traitements différés d'un fichier uploadé.
+
+    Response:
+        {
+            "success": true,
+            "file": {
+                "id": "file_abc123",
+                "thumbnailURL": "http://.../uploads/chat/thumbs/file_abc123_thumb.jpg",
+                "thumbnailStatus": "ready"
+            }
+        }
+    """
+    chat_upload_folder = get_chat_upload_folder()
+    meta = load_upload_meta(chat_upload_folder, file_id)
+
+    if meta is None:
+        return jsonify({
+            'success': False,
+            'error': 'Fichier non trouvé'
+        }), 404
+
+    thumbnail_url = None
+    thumbnail_status = None
+    if get_file_type(meta['ext']) == 'image':
+        thumbnail_url = get_thumbnail_url(chat_upload_folder, file_id, meta)
+        thumbnail_status = 'ready' if thumbnail_url else 'pending'
+
+    return jsonify({
+        'success': True,
+        'file': {
+            'id': file_id,
+            'thumbnailURL': thumbnail_url,
+            'thumbnailStatus': thumbnail_status
+        }
+    })
+
+
 # =============================================================================
 # ROUTE: Suppression de Fichier
 # =============================================================================
@@ -363,23 +1803,22 @@ def extract_pdf_text(pdf_path):
 def delete_file(file_id):
     """Supprime un fichier uploadé."""
     try:
-        upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-        chat_upload_folder = os.path.join(upload_folder, 'chat')
-        thumbs_folder = os.path.join(chat_upload_folder, 'thumbs')
-
-        # Chercher et supprimer le fichier
-        deleted = False
-        for ext in (ALLOWED_IMAGE_EXTENSIONS | ALLOWED_DOCUMENT_EXTENSIONS):
-            file_path = os.path.join(chat_upload_folder, f"{file_id}.{ext}")
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                deleted = True
-
-                # Supprimer aussi la miniature si elle existe
-                thumb_path = os.path.join(thumbs_folder, f"{file_id}_thumb.{ext}")
-                if os.path.exists(thumb_path):
-                    os.remove(thumb_path)
-                break
+        chat_upload_folder = get_chat_upload_folder()
+
+        # Le nettoyage périodique n'aura plus à s'en occuper, et une miniature en
+        # cours de création ne sera plus écrite
+        mark_alloc_deleted(chat_upload_folder, file_id)
+
+        # Supprimer le fichier à partir de son extension enregistrée
+        meta = load_upload_meta(chat_upload_folder, file_id)
+        if meta is not None:
+            deleted = remove_upload(chat_upload_folder, file_id, meta['ext'], meta['digest'])
+        else:
+            # Fichiers uploadés avant les métadonnées : chercher l'extension
+            deleted = any(
+                remove_upload(chat_upload_folder, file_id, ext)
+                for ext in ALL_UPLOAD_EXTENSIONS
+            )
 
         if deleted:
             return jsonify({'success': True})
@@ -396,6 +1835,70 @@ def delete_file(file_id):
         }), 500
 
 
+# =============================================================================
+# ROUTE: Service des Fichiers Uploadés
+# =============================================================================
+
+@chat_uploads_bp.route('/<path:filename>', methods=['GET'])
+def serve_chat_upload(filename):
+    """
+    Sert un fichier uploadé (ou sa miniature) avec un ETag fort.
+
+    Les fichiers étant immuables, un client qui renvoie `If-None-Match` reçoit
+    un `304 Not Modified` sans corps.
+
+    Le corps passe par `wsgi.file_wrapper`, soit sendfile(2) sans copie en espace
+    utilisateur sous gunicorn (sync/gevent) ou uWSGI (`--wsgi-file-wrapper`).
+    Derrière nginx, `CHAT_UPLOADS_ACCEL_REDIRECT` (ex: '/internal-uploads/chat',
+    location `internal`) délègue entièrement l'envoi à nginx via X-Accel-Redirect.
+    Les miniatures rangées dans un pack sont toujours lues depuis son mmap.
+    """
+    if not is_public_upload_path(filename):
+        abort(404)
+
+    chat_upload_folder = os.path.abspath(get_chat_upload_folder())
+    file_id, is_thumbnail = parse_upload_path(filename)
+    meta = load_upload_meta(chat_upload_folder, file_id)
+    etag = get_upload_etag(meta, is_thumbnail)
+
+    # Miniature rangée dans un pack : lue depuis le mmap du processus
+    if is_thumbnail and meta and 'thumb' in meta:
+        response = current_app.response_class(
+            read_packed_thumbnail(chat_upload_folder, meta['thumb']),
+            mimetype='image/jpeg'
+        )
+        response.cache_control.public = True
+        response.cache_control.max_age = UPLOAD_CACHE_MAX_AGE
+        response.set_etag(etag)
+        return response.make_conditional(request)
+
+    accel_prefix = current_app.config.get('CHAT_UPLOADS_ACCEL_REDIRECT')
+    if accel_prefix:
+        if safe_join(chat_upload_folder, filename) is None:
+            abort(404)
+
+        response = current_app.response_class(
+            mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        )
+        response.cache_control.public = True
+        response.cache_control.max_age = UPLOAD_CACHE_MAX_AGE
+        if etag:
+            response.set_etag(etag)
+            response.make_conditional(request)
+
+        if response.status_code != 304:
+            response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{filename}"
+        return response
+
+    return send_from_directory(
+        chat_upload_folder,
+        filename,
+        conditional=True,
+        etag=etag or True,
+        max_age=UPLOAD_CACHE_MAX_AGE
+    )
+
+
 # =============================================================================
 # Configuration à ajouter dans votre app Flask principale
 # =============================================================================
@@ -403,14 +1906,21 @@ def delete_file(file_id):
 """
 # Dans votre fichier app.py ou __init__.py, ajoutez:
 
-from chat_media_routes import chat_media_bp
+from chat_media_routes import chat_media_bp, chat_uploads_bp, MAX_AUDIO_SIZE, MULTIPART_OVERHEAD
 
-# Enregistrer le blueprint
+# Enregistrer les blueprints
 app.register_blueprint(chat_media_bp)
+app.register_blueprint(chat_uploads_bp)  # /uploads/chat/... avec ETag + 304
+
+# Derrière nginx (optionnel) : envoi des fichiers du chat délégué à nginx
+# location /internal-uploads/chat/ { internal; alias /chemin/vers/uploads/chat/; }
+# app.config['CHAT_UPLOADS_ACCEL_REDIRECT'] = '/internal-uploads/chat'
 
 # Configuration des uploads
 app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['MAX_CONTENT_LENGTH'] = 25 * 1024 * 1024  # 25 MB max
+# Corps refusés par Werkzeug au-delà, avant toute lecture (audio 25 MB + marge multipart)
+app.config['MAX_CONTENT_LENGTH'] = MAX_AUDIO_SIZE + MULTIPART_OVERHEAD
+# app.config['CHAT_UPLOADS_TTL'] = 30 * 24 * 3600  # Expiration des uploads (désactivée par défaut)
 
 # Servir les fichiers statiques (pour le développement)
 from flask import send_from_directory
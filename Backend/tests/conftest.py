@@ -0,0 +1,39 @@
+"""
+Fixtures communes : application Flask minimale avec les blueprints du chat,
+uploads rangés dans un dossier temporaire.
+
+Lancement depuis `Backend/` :
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chat_media_routes  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    app.register_blueprint(chat_media_routes.chat_media_bp)
+    app.register_blueprint(chat_media_routes.chat_uploads_bp)
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def chat_folder(tmp_path):
+    folder = tmp_path / 'chat'
+    (folder / 'cas' / 'incoming').mkdir(parents=True)
+    return str(folder)
@@ -0,0 +1,400 @@
+"""
+Tests des routes média du chat : stockage par contenu, journal d'allocation,
+packs de miniatures, détection du type des uploads et transcription.
+"""
+
+import io
+import os
+import shutil
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import chat_media_routes as cmr
+
+YES = shutil.which('yes')  # Résolu avant que les tests ne restreignent le PATH
+
+
+def make_transcript(*segments):
+    """Réponse Whisper `verbose_json` réduite à ses segments (début, fin, texte)."""
+    return SimpleNamespace(segments=[
+        SimpleNamespace(start=start, end=end, text=text) for start, end, text in segments
+    ])
+
+
+def publish(chat_folder, file_id, ext, content):
+    """Publie un fichier comme le fait l'upload : contenu rangé, métadonnées, journal."""
+    digest = cmr.new_content_hash()
+    digest.update(content)
+    digest = digest.hexdigest()
+
+    temp_path = os.path.join(chat_folder, 'cas', 'incoming', f"{file_id}.{ext}")
+    with open(temp_path, 'wb') as f:
+        f.write(content)
+
+    file_path = os.path.join(chat_folder, f"{file_id}.{ext}")
+    cmr.store_content_addressed(chat_folder, temp_path, digest, ext, file_path)
+    cmr.save_upload_meta(chat_folder, file_id, ext, digest)
+    cmr.append_alloc_record(chat_folder, file_id, ext)
+    return file_path, digest
+
+
+def read_alloc_keys(chat_folder):
+    with open(os.path.join(chat_folder, cmr.ALLOC_LOG_NAME), 'rb') as f:
+        log = f.read()
+    return [
+        cmr.ALLOC_RECORD.unpack_from(log, offset)[0].decode('ascii')
+        for offset in range(0, len(log), cmr.ALLOC_RECORD.size)
+    ]
+
+
+def upload(client, content, filename):
+    return client.post(
+        '/api/chat/upload',
+        data={'file': (io.BytesIO(content), filename)},
+        content_type='multipart/form-data'
+    )
+
+
+# =============================================================================
+# Recollage des fenêtres de transcription
+# =============================================================================
+
+def test_merge_drops_overlap_duplicates():
+    first = make_transcript((0, 10, 'Bonjour à tous.'), (10, 29.5, "Aujourd'hui séance de fractionné."))
+    second = make_transcript((0, 1.5, " Aujourd'hui séance de fractionné. "), (1.5, 12, 'Dix fois 400 mètres.'))
+
+    text = cmr.merge_chunk_transcripts([(0, first), (28, second)])
+
+    assert text == "Bonjour à tous. Aujourd'hui séance de fractionné. Dix fois 400 mètres."
+
+
+def test_merge_keeps_distinct_text_in_overlap():
+    first = make_transcript((0, 29.5, 'Échauffement de vingt minutes.'))
+    second = make_transcript((0, 1.5, 'Puis trois accélérations.'))
+
+    text = cmr.merge_chunk_transcripts([(0, first), (28, second)])
+
+    assert text == 'Échauffement de vingt minutes. Puis trois accélérations.'
+
+
+def test_merge_keeps_repeated_text_after_overlap():
+    first = make_transcript((0, 10, 'Encore.'))
+    second = make_transcript((5, 7, 'Encore.'))
+
+    assert cmr.merge_chunk_transcripts([(0, first), (28, second)]) == 'Encore. Encore.'
+
+
+def test_merge_ignores_empty_windows():
+    assert cmr.merge_chunk_transcripts([(0, SimpleNamespace(segments=None))]) == ''
+
+
+# =============================================================================
+# Stockage par contenu
+# =============================================================================
+
+def test_same_content_is_stored_once(chat_folder):
+    first_path, digest = publish(chat_folder, 'file_000000000001', 'pdf', b'%PDF-1.4 plan')
+    second_path, _ = publish(chat_folder, 'file_000000000002', 'pdf', b'%PDF-1.4 plan')
+
+    blob_path = cmr.get_content_blob_path(chat_folder, digest, 'pdf')
+    assert os.stat(first_path).st_ino == os.stat(second_path).st_ino == os.stat(blob_path).st_ino
+    assert os.stat(blob_path).st_nlink == 3
+    assert os.listdir(os.path.join(chat_folder, 'cas', 'incoming')) == []
+
+
+def test_blob_released_with_last_reference(chat_folder):
+    first_path, digest = publish(chat_folder, 'file_000000000001', 'pdf', b'%PDF-1.4 plan')
+    second_path, _ = publish(chat_folder, 'file_000000000002', 'pdf', b'%PDF-1.4 plan')
+    blob_path = cmr.get_content_blob_path(chat_folder, digest, 'pdf')
+
+    os.unlink(first_path)
+    cmr.release_content_blob(chat_folder, digest, 'pdf')
+    assert os.path.exists(blob_path)
+
+    os.unlink(second_path)
+    cmr.release_content_blob(chat_folder, digest, 'pdf')
+    assert not os.path.exists(blob_path)
+
+    # Contenu déjà libéré : sans effet
+    cmr.release_content_blob(chat_folder, digest, 'pdf')
+
+
+def test_store_republishes_released_blob(chat_folder):
+    first_path, digest = publish(chat_folder, 'file_000000000001', 'txt', b'notes')
+    assert cmr.remove_upload(chat_folder, 'file_000000000001', 'txt', digest)
+    assert not os.path.exists(cmr.get_content_blob_path(chat_folder, digest, 'txt'))
+
+    second_path, _ = publish(chat_folder, 'file_000000000002', 'txt', b'notes')
+
+    assert os.stat(second_path).st_nlink == 2
+    with open(cmr.get_content_blob_path(chat_folder, digest, 'txt'), 'rb') as f:
+        assert f.read() == b'notes'
+
+
+# =============================================================================
+# Journal d'allocation et nettoyage
+# =============================================================================
+
+def test_alloc_key_requires_file_id():
+    assert cmr.get_alloc_key('file_0123456789ab') == b'0123456789ab'
+    assert cmr.get_alloc_key('file_0123') is None
+    assert cmr.get_alloc_key('job_0123456789ab') is None
+
+
+def test_mark_deleted_ignores_misaligned_matches(chat_folder):
+    cmr.append_alloc_record(chat_folder, 'file_000000000001', 'png')
+
+    assert not cmr.mark_alloc_deleted(chat_folder, 'file_000000000002')
+    assert cmr.mark_alloc_deleted(chat_folder, 'file_000000000001')
+    # Déjà marqué : l'enregistrement n'est plus trouvé
+    assert not cmr.mark_alloc_deleted(chat_folder, 'file_000000000001')
+
+
+def test_cleanup_compacts_without_ttl(chat_folder):
+    for index in range(1, 6):
+        publish(chat_folder, f'file_00000000000{index}', 'txt', f'notes {index}'.encode())
+    for index in (1, 3, 4):
+        cmr.mark_alloc_deleted(chat_folder, f'file_00000000000{index}')
+
+    assert cmr.cleanup_expired_uploads(chat_folder, 0) == 0
+
+    assert read_alloc_keys(chat_folder) == ['000000000002', '000000000005']
+    assert os.path.exists(os.path.join(chat_folder, 'file_000000000002.txt'))
+
+
+def test_cleanup_removes_expired_uploads(chat_folder, monkeypatch):
+    with monkeypatch.context() as patch:
+        patch.setattr(time, 'time', lambda: 1_000_000_000)
+        old_path, old_digest = publish(chat_folder, 'file_000000000001', 'txt', b'ancien')
+    fresh_path, _ = publish(chat_folder, 'file_000000000002', 'txt', b'recent')
+
+    assert cmr.cleanup_expired_uploads(chat_folder, 3600) == 1
+
+    assert not os.path.exists(old_path)
+    assert not os.path.exists(os.path.join(chat_folder, 'file_000000000001.meta'))
+    assert not os.path.exists(cmr.get_content_blob_path(chat_folder, old_digest, 'txt'))
+    assert os.path.exists(fresh_path)
+    assert read_alloc_keys(chat_folder) == ['000000000002']
+
+
+def test_cleanup_without_log_does_nothing(chat_folder):
+    assert cmr.cleanup_expired_uploads(chat_folder, 0) == 0
+    assert not os.path.exists(os.path.join(chat_folder, cmr.ALLOC_LOG_NAME))
+
+
+def test_cleanup_removes_unreferenced_packs(chat_folder):
+    publish(chat_folder, 'file_000000000001', 'png', b'image 1')
+    publish(chat_folder, 'file_000000000002', 'png', b'image 2')
+    assert cmr.store_thumbnail(chat_folder, 'file_000000000001', b'miniature 1')
+
+    # Pack plein : la miniature suivante ouvre le pack 1
+    with open(cmr.get_thumb_pack_path(chat_folder, 0), 'ab') as f:
+        f.truncate(cmr.THUMB_PACK_SEGMENT_SIZE)
+    assert cmr.store_thumbnail(chat_folder, 'file_000000000002', b'miniature 2')
+    assert cmr.load_upload_meta(chat_folder, 'file_000000000002')['thumb'] == [1, 0, len(b'miniature 2')]
+
+    cmr.cleanup_expired_uploads(chat_folder, 0)
+    assert sorted(cmr.list_thumb_pack_segments(chat_folder)) == [0, 1]
+
+    cmr.mark_alloc_deleted(chat_folder, 'file_000000000001')
+    cmr.cleanup_expired_uploads(chat_folder, 0)
+    assert cmr.list_thumb_pack_segments(chat_folder) == [1]
+
+    # Le pack courant reste ouvert même sans miniature vivante
+    cmr.mark_alloc_deleted(chat_folder, 'file_000000000002')
+    cmr.cleanup_expired_uploads(chat_folder, 0)
+    assert cmr.list_thumb_pack_segments(chat_folder) == [1]
+
+
+# =============================================================================
+# Miniatures
+# =============================================================================
+
+def test_store_thumbnail_packs_small_thumbnail(chat_folder):
+    publish(chat_folder, 'file_000000000001', 'png', b'image')
+
+    assert cmr.store_thumbnail(chat_folder, 'file_000000000001', b'miniature')
+
+    meta = cmr.load_upload_meta(chat_folder, 'file_000000000001')
+    assert meta['ext'] == 'png'
+    assert meta['thumb'] == [0, 0, len(b'miniature')]
+    assert cmr.read_packed_thumbnail(chat_folder, meta['thumb']) == b'miniature'
+
+
+def test_store_thumbnail_writes_large_thumbnail_apart(chat_folder):
+    publish(chat_folder, 'file_000000000001', 'png', b'image')
+    data = b'x' * (cmr.THUMB_PACK_MAX_SIZE + 1)
+
+    assert cmr.store_thumbnail(chat_folder, 'file_000000000001', data)
+
+    with open(os.path.join(chat_folder, 'thumbs', 'file_000000000001_thumb.jpg'), 'rb') as f:
+        assert f.read() == data
+    assert 'thumb' not in cmr.load_upload_meta(chat_folder, 'file_000000000001')
+
+
+@pytest.mark.parametrize('size', [16, cmr.THUMB_PACK_MAX_SIZE + 1])
+def test_store_thumbnail_skips_deleted_file(chat_folder, size):
+    publish(chat_folder, 'file_000000000001', 'png', b'image')
+    cmr.mark_alloc_deleted(chat_folder, 'file_000000000001')
+
+    assert not cmr.store_thumbnail(chat_folder, 'file_000000000001', b'x' * size)
+
+    assert os.listdir(os.path.join(chat_folder, 'thumbs', 'packs')) == []
+    assert not os.path.exists(os.path.join(chat_folder, 'thumbs', 'file_000000000001_thumb.jpg'))
+
+
+def test_store_thumbnail_skips_removed_file(chat_folder):
+    _, digest = publish(chat_folder, 'file_000000000001', 'png', b'image')
+    cmr.remove_upload(chat_folder, 'file_000000000001', 'png', digest)
+
+    assert not cmr.store_thumbnail(chat_folder, 'file_000000000001', b'miniature')
+    assert not os.path.exists(os.path.join(chat_folder, 'file_000000000001.meta'))
+
+
+def test_delete_removes_legacy_thumbnail(client, chat_folder):
+    # Upload antérieur aux métadonnées : miniature au format de l'image
+    thumbs_folder = os.path.join(chat_folder, 'thumbs')
+    os.makedirs(thumbs_folder)
+    for path in (os.path.join(chat_folder, 'file_000000000001.png'),
+                 os.path.join(thumbs_folder, 'file_000000000001_thumb.png')):
+        with open(path, 'wb') as f:
+            f.write(b'image')
+
+    response = client.delete('/api/chat/files/file_000000000001')
+
+    assert response.status_code == 200
+    assert not os.path.exists(os.path.join(chat_folder, 'file_000000000001.png'))
+    assert os.listdir(thumbs_folder) == []
+    assert client.get('/uploads/chat/thumbs/file_000000000001_thumb.png').status_code == 404
+
+
+# =============================================================================
+# Détection du type des uploads
+# =============================================================================
+
+@pytest.mark.parametrize('content, filename, mime', [
+    (b'def main():\n    print("plan")\n' * 20, 'plan.txt', 'text/plain'),
+    (b'# Semaine 1\n\n- Lundi : repos\n' * 20, 'semaine.md', 'text/markdown'),
+    (b'{"distance": 10}', 'seance.txt', 'text/plain'),
+])
+def test_upload_accepts_text_documents(client, content, filename, mime):
+    response = upload(client, content, filename)
+
+    assert response.status_code == 200
+    assert response.json['file']['type'] == 'document'
+    assert response.json['file']['mimeType'] == mime
+
+
+@pytest.mark.parametrize('content, filename', [
+    (b'\x89PNG\r\n\x1a\n' + b'\x00' * 64, 'notes.txt'),
+    (b'Ceci est du texte, pas un PDF.\n' * 20, 'plan.pdf'),
+    (b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n' + b'\x00' * 64, 'photo.jpg'),
+])
+def test_upload_rejects_mismatched_content(client, chat_folder, content, filename):
+    response = upload(client, content, filename)
+
+    assert response.status_code == 400
+    assert response.json['success'] is False
+    assert 'Contenu du fichier non supporté' in response.json['error']
+    assert os.listdir(os.path.join(chat_folder, 'cas', 'incoming')) == []
+
+
+def test_upload_rejects_unknown_extension(client):
+    response = upload(client, b'MZ', 'setup.exe')
+
+    assert response.status_code == 400
+    assert response.json['error'] == cmr.UPLOAD_FORMAT_ERROR
+
+
+# =============================================================================
+# Transcription d'un audio transcodé
+# =============================================================================
+
+class FakeClient:
+    def with_options(self, **options):
+        return self
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch):
+    """Installe un `ffmpeg` factice (script shell) en tête du PATH."""
+    bin_folder = tmp_path / 'bin'
+    bin_folder.mkdir()
+
+    def install(script):
+        ffmpeg = bin_folder / 'ffmpeg'
+        ffmpeg.write_text(f"#!/bin/sh\n{script}\n")
+        ffmpeg.chmod(0o755)
+
+    monkeypatch.setenv('PATH', str(bin_folder))
+    return install
+
+
+@pytest.fixture
+def audio_path(tmp_path):
+    path = tmp_path / 'memo.m4a'
+    path.write_bytes(b'\x00\x00\x00\x18ftypM4A ' + b'\x00' * 64)
+    return str(path)
+
+
+def test_transcoded_stream_sent_to_whisper(app, fake_ffmpeg, audio_path, monkeypatch):
+    fake_ffmpeg("printf 'OggS opus'")
+    calls = []
+
+    def request_transcription(client, file, language):
+        name, reader, _ = file
+        calls.append((name, reader.read(), language))
+        return 'transcription'
+
+    monkeypatch.setattr(cmr, 'request_transcription', request_transcription)
+
+    assert cmr.transcribe_transcoded(FakeClient(), audio_path, 'fr', 'memo.m4a') == 'transcription'
+    assert calls == [('audio.ogg', b'OggS opus', 'fr')]
+
+
+def test_transcoding_failure_sends_original(app, fake_ffmpeg, audio_path, monkeypatch):
+    fake_ffmpeg("echo 'Invalid data found' >&2; exit 1")
+    calls = []
+
+    def request_transcription(client, file, language):
+        name, audio = file[:2]
+        calls.append((name, audio.read()))
+        return 'transcription'
+
+    monkeypatch.setattr(cmr, 'request_transcription', request_transcription)
+
+    assert cmr.transcribe_transcoded(FakeClient(), audio_path, 'fr', 'memo.m4a') == 'transcription'
+    with open(audio_path, 'rb') as f:
+        assert calls == [('audio.ogg', b''), ('memo.m4a', f.read())]
+
+
+def test_missing_ffmpeg_sends_original(app, tmp_path, audio_path, monkeypatch):
+    monkeypatch.setenv('PATH', str(tmp_path))
+    calls = []
+
+    def request_transcription(client, file, language):
+        calls.append(file[0])
+        return 'transcription'
+
+    monkeypatch.setattr(cmr, 'request_transcription', request_transcription)
+
+    assert cmr.transcribe_transcoded(FakeClient(), audio_path, 'fr', 'memo.m4a') == 'transcription'
+    assert calls == ['memo.m4a']
+
+
+def test_early_whisper_error_is_raised(app, fake_ffmpeg, audio_path, monkeypatch):
+    # Sortie sans fin : ffmpeg meurt du pipe fermé quand Whisper refuse la requête
+    fake_ffmpeg(f"exec {YES}")
+    calls = []
+
+    def request_transcription(client, file, language):
+        calls.append(file[0])
+        raise RuntimeError('429 Too Many Requests')
+
+    monkeypatch.setattr(cmr, 'request_transcription', request_transcription)
+
+    with pytest.raises(RuntimeError, match='429'):
+        cmr.transcribe_transcoded(FakeClient(), audio_path, 'fr', 'memo.m4a')
+    assert calls == ['audio.ogg']
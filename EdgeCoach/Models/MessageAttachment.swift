@@ -185,6 +185,8 @@ struct UploadResponse: Decodable {
 
 struct TranscriptionResponse: Decodable {
     let success: Bool
+    let status: String?   // "pending" tant que Whisper n'a pas répondu, puis "done"
+    let jobId: String?
     let text: String?
     let duration: Double?
     let language: String?
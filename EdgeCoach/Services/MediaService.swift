@@ -45,6 +45,8 @@ class MediaService {
     private let api = APIService.shared
     private let maxFileSize = 20 * 1024 * 1024  // 20 MB
     private let maxAudioSize = 25 * 1024 * 1024 // 25 MB
+    private let transcriptionPollInterval: UInt64 = 1_000_000_000  // 1s
+    private let transcriptionTimeout: TimeInterval = 120
 
     private let allowedImageTypes: Set<String> = ["jpg", "jpeg", "png", "gif", "webp", "heic"]
     private let allowedDocumentTypes: Set<String> = ["pdf", "txt", "md"]
@@ -192,7 +194,7 @@ class MediaService {
 
         // Construire l'URL
         let baseUrl = api.baseURL.replacingOccurrences(of: "/api", with: "")
-        let urlString = "\(baseUrl)/api/chat/transcribe"
+        let urlString = "\(baseUrl)/api/chat/transcribe?async=1"
 
         guard let url = URL(string: urlString) else {
             throw MediaServiceError.transcriptionFailed("URL invalide")
@@ -212,6 +214,11 @@ class MediaService {
         // Construire le body multipart
         var body = Data()
 
+        // Langue (avant l'audio : le backend relaie l'audio vers Whisper pendant sa réception)
+        body.append("--\(boundary)\r\n".data(using: .utf8)!)
+        body.append("Content-Disposition: form-data; name=\"language\"\r\n\r\n".data(using: .utf8)!)
+        body.append("\(language)\r\n".data(using: .utf8)!)
+
         // Fichier audio
         let fileName = fileURL.lastPathComponent
         let mimeType = self.mimeType(for: fileURL)
@@ -221,11 +228,6 @@ class MediaService {
         body.append(data)
         body.append("\r\n".data(using: .utf8)!)
 
-        // Langue
-        body.append("--\(boundary)\r\n".data(using: .utf8)!)
-        body.append("Content-Disposition: form-data; name=\"language\"\r\n\r\n".data(using: .utf8)!)
-        body.append("\(language)\r\n".data(using: .utf8)!)
-
         body.append("--\(boundary)--\r\n".data(using: .utf8)!)
 
         request.httpBody = body
@@ -241,19 +243,24 @@ class MediaService {
             throw MediaServiceError.invalidResponse
         }
 
-        guard httpResponse.statusCode == 200 else {
+        guard httpResponse.statusCode == 200 || httpResponse.statusCode == 202 else {
             let errorMessage = String(data: responseData, encoding: .utf8) ?? "Erreur inconnue"
             throw MediaServiceError.transcriptionFailed(errorMessage)
         }
 
         // Décoder la réponse
         let decoder = JSONDecoder()
-        let transcriptionResponse = try decoder.decode(TranscriptionResponse.self, from: responseData)
+        var transcriptionResponse = try decoder.decode(TranscriptionResponse.self, from: responseData)
 
         guard transcriptionResponse.success else {
             throw MediaServiceError.transcriptionFailed(transcriptionResponse.error ?? "Erreur inconnue")
         }
 
+        // Le backend libère son worker pendant l'appel Whisper : on interroge le job
+        if transcriptionResponse.status == "pending", let jobId = transcriptionResponse.jobId {
+            transcriptionResponse = try await pollTranscription(jobId: jobId, baseUrl: baseUrl)
+        }
+
         #if DEBUG
         print("✅ Transcription: \(transcriptionResponse.text?.prefix(50) ?? "")...")
         #endif
@@ -261,6 +268,52 @@ class MediaService {
         return transcriptionResponse
     }
 
+    /// Attend le résultat d'une transcription asynchrone
+    private func pollTranscription(jobId: String, baseUrl: String) async throws -> TranscriptionResponse {
+        guard let url = URL(string: "\(baseUrl)/api/chat/transcribe/\(jobId)") else {
+            throw MediaServiceError.transcriptionFailed("URL invalide")
+        }
+
+        var request = URLRequest(url: url)
+        request.httpMethod = "GET"
+
+        if let token = api.authToken {
+            request.setValue("Bearer \(token)", forHTTPHeaderField: "Authorization")
+        }
+
+        let deadline = Date().addingTimeInterval(transcriptionTimeout)
+        let decoder = JSONDecoder()
+
+        while Date() < deadline {
+            try await Task.sleep(nanoseconds: transcriptionPollInterval)
+
+            let (responseData, response) = try await URLSession.shared.data(for: request)
+
+            guard let httpResponse = response as? HTTPURLResponse else {
+                throw MediaServiceError.invalidResponse
+            }
+
+            if httpResponse.statusCode == 202 {
+                continue
+            }
+
+            guard httpResponse.statusCode == 200 else {
+                let errorMessage = String(data: responseData, encoding: .utf8) ?? "Erreur inconnue"
+                throw MediaServiceError.transcriptionFailed(errorMessage)
+            }
+
+            let transcriptionResponse = try decoder.decode(TranscriptionResponse.self, from: responseData)
+
+            guard transcriptionResponse.success else {
+                throw MediaServiceError.transcriptionFailed(transcriptionResponse.error ?? "Erreur inconnue")
+            }
+
+            return transcriptionResponse
+        }
+
+        throw MediaServiceError.transcriptionFailed("Délai dépassé")
+    }
+
     // MARK: - Delete File
 
     /// Supprime un fichier du serveur
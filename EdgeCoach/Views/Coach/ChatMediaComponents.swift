@@ -542,6 +542,11 @@ struct AttachmentBubbleView: View {
     let isUser: Bool
 
     @State private var showingFullScreen = false
+    @State private var thumbnailAttempt = 0
+
+    /// La miniature est générée après l'upload : son URL répond 404 tant qu'elle n'est pas prête
+    private let maxThumbnailAttempts = 5
+    private let thumbnailRetryDelay: UInt64 = 1_000_000_000  // 1s
 
     var body: some View {
         Group {
@@ -568,18 +573,25 @@ struct AttachmentBubbleView: View {
                     Image(uiImage: uiImage)
                         .resizable()
                         .scaledToFill()
-                } else if let thumbnailURL = attachment.thumbnailRemoteURL {
-                    AsyncImage(url: thumbnailURL) { image in
-                        image
-                            .resizable()
-                            .scaledToFill()
-                    } placeholder: {
-                        Rectangle()
-                            .fill(themeManager.surfaceColor)
-                            .overlay(
-                                ProgressView()
-                            )
+                } else if let imageURL = thumbnailImageURL {
+                    AsyncImage(url: imageURL) { phase in
+                        switch phase {
+                        case .success(let image):
+                            image
+                                .resizable()
+                                .scaledToFill()
+                        case .failure:
+                            loadingPlaceholder
+                                .task {
+                                    guard thumbnailAttempt < maxThumbnailAttempts else { return }
+                                    try? await Task.sleep(nanoseconds: thumbnailRetryDelay)
+                                    thumbnailAttempt += 1
+                                }
+                        default:
+                            loadingPlaceholder
+                        }
                     }
+                    .id(thumbnailAttempt)
                 } else {
                     Rectangle()
                         .fill(themeManager.surfaceColor)
@@ -595,6 +607,22 @@ struct AttachmentBubbleView: View {
         }
     }
 
+    /// Miniature, puis image complète si elle n'est toujours pas prête après quelques essais
+    private var thumbnailImageURL: URL? {
+        if thumbnailAttempt < maxThumbnailAttempts, let thumbnailURL = attachment.thumbnailRemoteURL {
+            return thumbnailURL
+        }
+        return attachment.remoteURL
+    }
+
+    private var loadingPlaceholder: some View {
+        Rectangle()
+            .fill(themeManager.surfaceColor)
+            .overlay(
+                ProgressView()
+            )
+    }
+
     private var documentAttachmentView: some View {
         HStack(spacing: ECSpacing.sm) {
             Image(systemName: attachment.type.icon)
@@ -0,0 +1,135 @@
+//
+//  MediaModelsTests.swift
+//  EdgeCoachTests
+//
+//  Décodage JSON des réponses du backend media (upload, transcription)
+//
+
+import XCTest
+@testable import EdgeCoach
+
+final class MediaModelsTests: XCTestCase {
+
+    private let decoder = JSONDecoder()
+
+    // MARK: - TranscriptionResponse
+
+    func testDecodePendingTranscription() throws {
+        let json = #"{"success": true, "status": "pending", "jobId": "job_0123456789ab"}"#
+
+        let response = try decoder.decode(TranscriptionResponse.self, from: Data(json.utf8))
+
+        XCTAssertTrue(response.success)
+        XCTAssertEqual(response.status, "pending")
+        XCTAssertEqual(response.jobId, "job_0123456789ab")
+        XCTAssertNil(response.text)
+    }
+
+    func testDecodeDoneTranscription() throws {
+        let json = #"{"success": true, "status": "done", "text": "Bonjour", "duration": 5.2, "language": "fr"}"#
+
+        let response = try decoder.decode(TranscriptionResponse.self, from: Data(json.utf8))
+
+        XCTAssertEqual(response.status, "done")
+        XCTAssertNil(response.jobId)
+        XCTAssertEqual(response.text, "Bonjour")
+        XCTAssertEqual(response.duration ?? 0, 5.2, accuracy: 0.001)
+        XCTAssertEqual(response.language, "fr")
+    }
+
+    func testDecodeLegacyTranscriptionWithoutStatus() throws {
+        // Backend antérieur aux transcriptions asynchrones : ni `status` ni `jobId`
+        let json = #"{"success": true, "text": "Salut", "duration": 1.0, "language": "fr"}"#
+
+        let response = try decoder.decode(TranscriptionResponse.self, from: Data(json.utf8))
+
+        XCTAssertNil(response.status)
+        XCTAssertNil(response.jobId)
+        XCTAssertEqual(response.text, "Salut")
+    }
+
+    func testDecodeTranscriptionError() throws {
+        let json = #"{"success": false, "status": "error", "error": "Délai dépassé"}"#
+
+        let response = try decoder.decode(TranscriptionResponse.self, from: Data(json.utf8))
+
+        XCTAssertFalse(response.success)
+        XCTAssertEqual(response.error, "Délai dépassé")
+    }
+
+    // MARK: - UploadResponse
+
+    func testDecodeUploadWithPendingThumbnail() throws {
+        let json = #"""
+        {
+            "success": true,
+            "file": {
+                "id": "file_0123456789ab",
+                "type": "image",
+                "fileName": "photo.jpg",
+                "fileURL": "http://localhost/uploads/chat/file_0123456789ab.jpg",
+                "thumbnailURL": "http://localhost/uploads/chat/thumbs/file_0123456789ab_thumb.jpg",
+                "thumbnailStatus": "pending",
+                "fileSize": 123456,
+                "mimeType": "image/jpeg",
+                "etag": "9f86d081884c7d65"
+            }
+        }
+        """#
+
+        let response = try decoder.decode(UploadResponse.self, from: Data(json.utf8))
+        let file = try XCTUnwrap(response.file)
+
+        XCTAssertEqual(file.id, "file_0123456789ab")
+        XCTAssertEqual(file.thumbnailURL, "http://localhost/uploads/chat/thumbs/file_0123456789ab_thumb.jpg")
+        XCTAssertEqual(file.fileSize, 123456)
+        XCTAssertNil(file.extractedText)
+    }
+
+    func testDecodeUploadDocumentWithoutThumbnail() throws {
+        let json = #"""
+        {
+            "success": true,
+            "file": {
+                "id": "file_0123456789ab",
+                "type": "document",
+                "fileName": "notes.md",
+                "fileURL": "http://localhost/uploads/chat/file_0123456789ab.md",
+                "thumbnailURL": null,
+                "thumbnailStatus": null,
+                "fileSize": 12,
+                "mimeType": "text/markdown"
+            }
+        }
+        """#
+
+        let response = try decoder.decode(UploadResponse.self, from: Data(json.utf8))
+        let file = try XCTUnwrap(response.file)
+
+        XCTAssertNil(file.thumbnailURL)
+        XCTAssertEqual(file.mimeType, "text/markdown")
+    }
+
+    // MARK: - MessageAttachment
+
+    func testAttachmentRoundTripDropsLocalState() throws {
+        let attachment = MessageAttachment(
+            id: "file_0123456789ab",
+            type: .image,
+            fileName: "photo.jpg",
+            fileURL: "http://localhost/uploads/chat/file_0123456789ab.jpg",
+            thumbnailURL: "http://localhost/uploads/chat/thumbs/file_0123456789ab_thumb.jpg",
+            isUploading: true,
+            localURL: URL(fileURLWithPath: "/tmp/photo.jpg")
+        )
+
+        let data = try JSONEncoder().encode(attachment)
+        let decoded = try decoder.decode(MessageAttachment.self, from: data)
+
+        // L'historique synchronisé n'a que les URLs distantes : la miniature doit y être
+        XCTAssertNil(decoded.localURL)
+        XCTAssertFalse(decoded.isUploading)
+        XCTAssertEqual(decoded.thumbnailRemoteURL, attachment.thumbnailRemoteURL)
+        XCTAssertEqual(decoded.remoteURL, attachment.remoteURL)
+    }
+}
@@ -0,0 +1,178 @@
+//
+//  MediaServiceTests.swift
+//  EdgeCoachTests
+//
+//  Transcription asynchrone : 202 + jobId puis interrogation du job
+//
+
+import XCTest
+@testable import EdgeCoach
+
+// MARK: - Stub réseau
+
+/// Intercepte les requêtes de URLSession.shared et rejoue des réponses préparées
+final class StubURLProtocol: URLProtocol {
+
+    struct StubResponse {
+        let statusCode: Int
+        let body: String
+    }
+
+    private static let lock = NSLock()
+    private static var queue: [StubResponse] = []
+    private static var recorded: [URLRequest] = []
+
+    static func enqueue(_ responses: [StubResponse]) {
+        lock.lock()
+        defer { lock.unlock() }
+        queue.append(contentsOf: responses)
+    }
+
+    static var requests: [URLRequest] {
+        lock.lock()
+        defer { lock.unlock() }
+        return recorded
+    }
+
+    static func reset() {
+        lock.lock()
+        defer { lock.unlock() }
+        queue.removeAll()
+        recorded.removeAll()
+    }
+
+    private static func next(for request: URLRequest) -> StubResponse? {
+        lock.lock()
+        defer { lock.unlock() }
+        recorded.append(request)
+        return queue.isEmpty ? nil : queue.removeFirst()
+    }
+
+    override class func canInit(with request: URLRequest) -> Bool {
+        request.url?.path.hasPrefix("/api/chat/transcribe") ?? false
+    }
+
+    override class func canonicalRequest(for request: URLRequest) -> URLRequest {
+        request
+    }
+
+    override func startLoading() {
+        guard let stub = Self.next(for: request), let url = request.url else {
+            client?.urlProtocol(self, didFailWithError: URLError(.resourceUnavailable))
+            return
+        }
+
+        let response = HTTPURLResponse(
+            url: url,
+            statusCode: stub.statusCode,
+            httpVersion: "HTTP/1.1",
+            headerFields: ["Content-Type": "application/json"]
+        )!
+        client?.urlProtocol(self, didReceive: response, cacheStoragePolicy: .notAllowed)
+        client?.urlProtocol(self, didLoad: Data(stub.body.utf8))
+        client?.urlProtocolDidFinishLoading(self)
+    }
+
+    override func stopLoading() {}
+}
+
+// MARK: - Tests
+
+@MainActor
+final class MediaServiceTests: XCTestCase {
+
+    private var audioURL: URL!
+
+    override func setUpWithError() throws {
+        try super.setUpWithError()
+        URLProtocol.registerClass(StubURLProtocol.self)
+        StubURLProtocol.reset()
+
+        audioURL = FileManager.default.temporaryDirectory
+            .appendingPathComponent("\(UUID().uuidString).m4a")
+        try Data(repeating: 0, count: 1024).write(to: audioURL)
+    }
+
+    override func tearDownWithError() throws {
+        URLProtocol.unregisterClass(StubURLProtocol.self)
+        StubURLProtocol.reset()
+        try? FileManager.default.removeItem(at: audioURL)
+        try super.tearDownWithError()
+    }
+
+    func testTranscribePollsPendingJobUntilDone() async throws {
+        StubURLProtocol.enqueue([
+            .init(statusCode: 202, body: #"{"success": true, "status": "pending", "jobId": "job_0123456789ab"}"#),
+            .init(statusCode: 202, body: #"{"success": true, "status": "pending", "jobId": "job_0123456789ab"}"#),
+            .init(statusCode: 200, body: #"{"success": true, "status": "done", "text": "Bonjour", "duration": 1.5, "language": "fr"}"#)
+        ])
+
+        let response = try await MediaService.shared.transcribeAudio(fileURL: audioURL)
+
+        XCTAssertEqual(response.status, "done")
+        XCTAssertEqual(response.text, "Bonjour")
+
+        let requests = StubURLProtocol.requests
+        XCTAssertEqual(requests.count, 3)
+        XCTAssertEqual(requests[0].httpMethod, "POST")
+        XCTAssertEqual(requests[0].url?.query, "async=1")
+        XCTAssertEqual(requests[1].httpMethod, "GET")
+        XCTAssertEqual(requests[1].url?.path, "/api/chat/transcribe/job_0123456789ab")
+        XCTAssertEqual(requests[2].url?.path, "/api/chat/transcribe/job_0123456789ab")
+    }
+
+    func testTranscribeReturnsSynchronousResultWithoutPolling() async throws {
+        // Backend sans job store : le texte arrive directement en 200
+        StubURLProtocol.enqueue([
+            .init(statusCode: 200, body: #"{"success": true, "text": "Salut", "duration": 1.0, "language": "fr"}"#)
+        ])
+
+        let response = try await MediaService.shared.transcribeAudio(fileURL: audioURL)
+
+        XCTAssertEqual(response.text, "Salut")
+        XCTAssertEqual(StubURLProtocol.requests.count, 1)
+    }
+
+    func testTranscribeFailsWhenJobFails() async throws {
+        StubURLProtocol.enqueue([
+            .init(statusCode: 202, body: #"{"success": true, "status": "pending", "jobId": "job_0123456789ab"}"#),
+            .init(statusCode: 500, body: #"{"success": false, "status": "error", "error": "Whisper indisponible"}"#)
+        ])
+
+        do {
+            _ = try await MediaService.shared.transcribeAudio(fileURL: audioURL)
+            XCTFail("La transcription aurait dû échouer")
+        } catch MediaServiceError.transcriptionFailed(let message) {
+            XCTAssertTrue(message.contains("Whisper indisponible"))
+        }
+
+        XCTAssertEqual(StubURLProtocol.requests.count, 2)
+    }
+
+    func testTranscribeFailsWhenJobReportsError() async throws {
+        StubURLProtocol.enqueue([
+            .init(statusCode: 202, body: #"{"success": true, "status": "pending", "jobId": "job_0123456789ab"}"#),
+            .init(statusCode: 200, body: #"{"success": false, "status": "error", "error": "Audio illisible"}"#)
+        ])
+
+        do {
+            _ = try await MediaService.shared.transcribeAudio(fileURL: audioURL)
+            XCTFail("La transcription aurait dû échouer")
+        } catch MediaServiceError.transcriptionFailed(let message) {
+            XCTAssertEqual(message, "Audio illisible")
+        }
+    }
+
+    func testTranscribeRejectsUnsupportedExtension() async throws {
+        let textURL = audioURL.deletingPathExtension().appendingPathExtension("txt")
+        try Data("pas de l'audio".utf8).write(to: textURL)
+        defer { try? FileManager.default.removeItem(at: textURL) }
+
+        do {
+            _ = try await MediaService.shared.transcribeAudio(fileURL: textURL)
+            XCTFail("Le fichier aurait dû être refusé")
+        } catch MediaServiceError.invalidFile {
+            XCTAssertTrue(StubURLProtocol.requests.isEmpty)
+        }
+    }
+}